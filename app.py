@@ -29,9 +29,16 @@ Instructions:
 
         supervisorctl restart app
 
+  (To share the loaded data between worker processes, run Gunicorn with
+  gunicorn.conf.py instead; see pyvocz/prefork.py.)
+
 - Configure the Github hook for pyvec/pyvo-data to
   POST to pyvo.cz/api/reload_hook?password=YOUR_RANDOM_PASSWORD
 
+  The data is reloaded in the background, and all worker processes pick
+  it up. The status of the reload, and the data version of each worker, is
+  at pyvo.cz/api/reload_status?password=YOUR_RANDOM_PASSWORD
+
 - If automated tweets of events are desired, set up pyvo-twitter according to
   https://github.com/pyvec/pyvo-twitter.
 
@@ -46,6 +53,8 @@ logging.basicConfig(level=logging.INFO)
 
 db = 'sqlite:////srv/app/db.sqlite'
 datadir = 'pyvo-data'
+snapshot = 'pyvo-data.snapshot'
+cache_dir = 'cache'
 host = 'pyvo.cz'
 port = 80
 
@@ -60,4 +69,10 @@ else:
 
 application = create_app(datadir=datadir, echo=False,
                          pull_password=pull_password,
-                         host=host, port=port)
+                         host=host, port=port, snapshot=snapshot,
+                         cache_dir=cache_dir,
+                         config={
+                             'PREFERRED_URL_SCHEME': 'https',
+                             'PYVO_WARM_UP': True,
+                             'PYVO_PREGENERATE_QRCODES': True,
+                         })
@@ -0,0 +1 @@
+"""Benchmarks of pyvocz (see benchmarks.run)"""
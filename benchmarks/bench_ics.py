@@ -0,0 +1,107 @@
+"""Compare the built-in iCalendar writer with the `ics` library
+
+Usage:
+  bench_ics.py [options]
+
+Options:
+  --data=DIR    Data directory [default: pyvo-data]
+  --repeat=N    Number of timed runs of each implementation [default: 5]
+
+Renders the calendar of all events (with tentative dates for all series),
+as served at /api/pyvo.ics, and reports the time and peak memory used by
+each implementation. Needs the `ics` library (`pip install -e .[bench]`).
+"""
+
+import datetime
+import time
+import tracemalloc
+
+import docopt
+import ics
+from dateutil.relativedelta import relativedelta
+
+from pyvocz.data import load_data
+from pyvocz.ical import generate_ics
+
+
+def event_url(event):
+    return f'https://pyvo.cz/{event.series.slug}/{event.slug}/'
+
+
+def old_ics(db):
+    """The calendar as it was generated using `ics` (the six-month version)"""
+    today = datetime.date.today()
+    events = []
+    for event in db.events:
+        if event.venue:
+            location = '{}, {}, {}'.format(
+                event.venue.name,
+                event.venue.short_address,
+                event.city.name,
+            )
+            geo_obj = event.venue
+        else:
+            location = event.city.name
+            geo_obj = event.city.location
+        cal_event = ics.Event(
+            name=event.title,
+            location=location,
+            begin=event.start,
+            uid='{}-{}@pyvo.cz'.format(event.series.slug, event.date),
+            url=event_url(event),
+            description=event.description,
+        )
+        cal_event.geo = float(geo_obj.latitude), float(geo_obj.longitude)
+        events.append(cal_event)
+
+    occurence_limit = (today + relativedelta(months=+6)).replace(day=1)
+    for series in db.series.values():
+        since = today + datetime.timedelta(days=1)
+        for occurence in series.next_occurrences(since=since):
+            if occurence.date() > occurence_limit:
+                break
+            events.append(ics.Event(
+                name='({} – tentative date)'.format(series.name),
+                begin=occurence,
+                uid='{}-{}@pyvo.cz'.format(series.slug, occurence.date()),
+                categories=['tentative-date'],
+            ))
+
+    return str(ics.Calendar(events=events))
+
+
+def new_ics(db):
+    return ''.join(generate_ics(
+        db.events, event_url=event_url, dtstamp=db.modified,
+        recurrence_series=db.series.values(),
+    ))
+
+
+def measure(func, db, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(db)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(db)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, len(result.encode('utf-8'))
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    db = load_data(arguments['--data'])
+    repeat = int(arguments['--repeat'])
+
+    print(f'{len(db.events)} events, {len(db.series)} series')
+    print(f'{"":8} {"best time":>10} {"peak memory":>12} {"size":>10}')
+    for name, func in ('ics', old_ics), ('pyvocz', new_ics):
+        best, peak, size = measure(func, db, repeat)
+        print(f'{name:8} {best*1000:8.1f}ms {peak/1024:10.0f}kB {size:10}')
+
+
+if __name__ == '__main__':
+    main()
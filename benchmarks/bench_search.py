@@ -0,0 +1,67 @@
+"""Measure building and querying the search index
+
+Usage:
+  bench_search.py [options] [<query>...]
+
+Options:
+  --data=DIR    Data directory [default: pyvo-data]
+  --repeat=N    Number of timed runs of each query [default: 1000]
+
+Builds the index (as served at /search/) and reports the time it takes,
+then the best and median time of each query. Without queries given,
+a mix of common and rare words from the data is used.
+"""
+
+import collections
+import statistics
+import time
+
+import docopt
+
+from pyvocz.data import load_data
+from pyvocz.search import SearchIndex
+
+
+def default_queries(index):
+    """Common and rare words, and pairs of them"""
+    by_frequency = sorted(index.ranked, key=lambda w: -len(index.ranked[w]))
+    common = by_frequency[:3]
+    rare = by_frequency[len(by_frequency) // 2:][:3]
+    return [
+        *common, *rare,
+        f'{common[0]} {common[1]}',
+        f'{common[0]} {rare[0]}',
+        'nonexistent-word',
+    ]
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    db = load_data(arguments['--data'])
+    repeat = int(arguments['--repeat'])
+
+    start = time.perf_counter()
+    index = SearchIndex.build(db)
+    build_time = time.perf_counter() - start
+    print(f'{len(db.events)} events, {len(index.documents)} documents, '
+          f'{len(index.ranked)} words; index built in {build_time*1000:.1f}ms')
+
+    queries = arguments['<query>'] or default_queries(index)
+    times = collections.defaultdict(list)
+    for i in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            times[query].append(time.perf_counter() - start)
+
+    print(f'{"query":30} {"results":>8} {"best":>9} {"median":>9}')
+    for query in queries:
+        total = index.search(query).total
+        best = min(times[query])
+        median = statistics.median(times[query])
+        print(f'{query[:30]:30} {total:8} '
+              f'{best*1e6:7.1f}µs {median*1e6:7.1f}µs')
+
+
+if __name__ == '__main__':
+    main()
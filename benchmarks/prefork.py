@@ -0,0 +1,165 @@
+"""Measure the memory used by each worker process, with and without pre-fork
+
+Usage:
+  benchmarks.prefork [options]
+
+Options:
+  --data=DIR        Data directory (synthetic data is generated if not given)
+  --events=N        Number of events in generated data [default: 5000]
+  --workers=N       Number of worker processes [default: 4]
+  --snapshot=FILE   Load the data from the given snapshot file
+
+Run from the repository root, as `python -m benchmarks.prefork`.
+Only works on Linux (memory is read from /proc/<pid>/smaps_rollup).
+
+In each mode, worker processes are forked; each one renders some pages
+and runs a full garbage collection, then reports its memory:
+- `private`: memory only this worker uses (Private_Clean + Private_Dirty)
+- `pss`: private memory plus its share of memory shared with others
+
+The modes are:
+- `separate`: each worker creates the app, as without pre-fork mode
+- `prefork`: workers are forked from a process that created the app
+- `prefork+freeze`: like `prefork`, but with gc.freeze() before forking
+  (see pyvocz.prefork)
+"""
+
+import gc
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import docopt
+
+from pyvocz import prefork
+from pyvocz.app import create_app
+
+from .synthetic import Sizes, generate_data
+
+
+MODES = 'separate', 'prefork', 'prefork+freeze'
+
+
+def make_app(datadir, snapshot):
+    return create_app(datadir=datadir, echo=False, snapshot=snapshot, config={
+        'PYVO_PREGENERATE_QRCODES': False,
+    })
+
+
+def work(app):
+    """Handle some requests, like a worker would"""
+    client = app.test_client()
+    urls = ['/', '/calendar/']
+    for series in app.db.series.values():
+        urls.append(f'/{series.slug}/')
+        urls.extend(f'/{series.slug}/{e.slug}/' for e in series.events[-3:])
+    for url in urls:
+        client.get(url)
+    gc.collect()
+
+
+def read_memory(pid):
+    """Return private and proportional set size of a process, in bytes"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, sep, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) * 1024
+    return {
+        'private': fields['Private_Clean'] + fields['Private_Dirty'],
+        'pss': fields['Pss'],
+    }
+
+
+def run_workers(num_workers, worker_main):
+    """Fork workers running worker_main; return their memory usage"""
+    # Workers wait (reading from `wait_fd`) until all of them are measured,
+    # so that pages they share are counted as shared
+    wait_fd, release_fd = os.pipe()
+    workers = []
+    for i in range(num_workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                os.close(release_fd)
+                worker_main()
+                os.write(write_fd, b'done')
+                os.read(wait_fd, 1)
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        workers.append((pid, read_fd))
+    os.close(wait_fd)
+    for pid, read_fd in workers:
+        os.read(read_fd, 4)
+    results = [read_memory(pid) for pid, read_fd in workers]
+    os.close(release_fd)
+    for pid, read_fd in workers:
+        os.waitpid(pid, 0)
+        os.close(read_fd)
+    return results
+
+
+def measure(mode, datadir, snapshot, num_workers):
+    """Return memory usage of workers in the given mode
+
+    The measurement runs in a new process (the "master"), so that
+    memory left over from other measurements isn't shared with workers.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            if mode == 'separate':
+                results = run_workers(
+                    num_workers, lambda: work(make_app(datadir, snapshot)),
+                )
+            else:
+                app = make_app(datadir, snapshot)
+                prefork.enable(app)
+                if mode == 'prefork+freeze':
+                    prefork.freeze()
+                results = run_workers(num_workers, lambda: work(app))
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump(results, f)
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(output)
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    num_workers = int(arguments['--workers'])
+    with tempfile.TemporaryDirectory() as tempdir:
+        datadir = arguments['--data']
+        if datadir is None:
+            datadir = Path(tempdir) / 'data'
+            sizes = Sizes.for_events(int(arguments['--events']))
+            generate_data(datadir, sizes)
+        snapshot = arguments['--snapshot']
+        report = {}
+        for mode in MODES:
+            workers = measure(mode, datadir, snapshot, num_workers)
+            report[mode] = workers
+            private = sum(w['private'] for w in workers) / len(workers)
+            pss = sum(w['pss'] for w in workers) / len(workers)
+            print(
+                f'{mode:16} private {private / 2**20:7.1f} MiB'
+                f'  pss {pss / 2**20:7.1f} MiB  (per worker)',
+                file=sys.stderr,
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Run benchmarks of loading and rendering on synthetic data
+
+Usage:
+  benchmarks.run [options]
+  benchmarks.run compare <old.json> <new.json> [--threshold=R]
+
+Options:
+  --sizes=N,...     Numbers of events to generate data with
+                    [default: 100,1000,5000]
+  --repeat=N        Number of timed runs of each stage [default: 5]
+  --out=FILE        Write the JSON report to FILE
+  --seed=N          Seed for generating the data [default: 0]
+  --end-year=Y      Year of the generated data; see benchmarks.synthetic
+                    [default: 2020]
+  --threshold=R     Ratio of times over which `compare` reports
+                    a regression [default: 1.2]
+
+Run from the repository root, as `python -m benchmarks.run`.
+
+For each size, synthetic data is generated (see benchmarks.synthetic)
+in a temporary directory, and each stage is run `repeat` times.
+The report has, for each stage: the time of the first run, the best time,
+and the peak memory allocated during an extra run (measured by
+tracemalloc).
+
+Calendars and pages are memoized per version of the data (see
+pyvocz.calendar and pyvocz.homepage). Before each run of those stages,
+the app gets a fresh copy of the data, so the memos are not reused.
+
+`compare` prints the ratios of best times between two reports,
+and exits with status 1 if any is above the threshold.
+"""
+
+import copy
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import attr
+import docopt
+from flask import g
+
+from pyvocz.app import create_app
+from pyvocz.calendar import get_calendar
+from pyvocz.data import Root, dict_from_path, load_data
+from pyvocz.typecheck import typecheck
+from pyvocz.views import make_feed, make_ics
+
+from .synthetic import Sizes, generate_data
+
+
+def stages(datadir):
+    """Yield (name, function, reset) for each stage to measure
+
+    `reset` is None, or a function to call (untimed) before each run.
+    Preparation that isn't measured happens between the yields.
+    """
+    yield 'load_data', lambda: load_data(datadir), None
+
+    data = dict_from_path(datadir, datadir)
+    yield 'Root.load', (
+        lambda: Root.load(copy.deepcopy(data), validate=False)
+    ), None
+
+    db = load_data(datadir)
+    yield 'typecheck', lambda: typecheck(db), None
+
+    app = create_app(datadir=datadir, echo=False, config={
+        'PYVO_PAGE_CACHE': False,
+        'PYVO_PREGENERATE_QRCODES': False,
+    })
+
+    def new_data():
+        # Memos are kept for the current data only; with a copy of
+        # the data, they start empty
+        app.db = attr.evolve(app.db)
+
+    db = app.db
+    year = max(db.events[-1].date.year - 1, db.events[0].date.year)
+    yield 'get_calendar', lambda: get_calendar(
+        app.db, first_year=year, first_month=1, num_months=12,
+    ), new_data
+
+    with app.test_request_context('/api/pyvo.ics'):
+        g.lang_code = 'cs'
+        yield 'make_ics', lambda: ''.join(
+            make_ics(db.events, recurrence_series=db.series.values()),
+        ), None
+        yield 'make_feed', lambda: make_feed(
+            db.events, 'http://localhost/api/pyvo.rss',
+        ).rss_str(pretty=True), None
+
+    client = app.test_client()
+    series = max(db.series.values(), key=lambda s: len(s.events))
+    event = series.events[len(series.events) // 2]
+    pages = {
+        'index': '/',
+        'series': f'/{series.slug}/',
+        'series_all': f'/{series.slug}/all/',
+        'event': f'/{series.slug}/{event.slug}/',
+        'calendar': f'/calendar/{year}/',
+    }
+    for name, url in pages.items():
+        yield (
+            f'page:{name}', lambda url=url: _get_page(client, url), new_data,
+        )
+
+
+def _get_page(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise AssertionError(f'{url}: {response.status}')
+    return response.data
+
+
+def measure(func, repeat, reset=None):
+    """Return timings and memory use of the given function, as a dict
+
+    If `reset` is given, it's called before each run, without timing it.
+    """
+    times = []
+    for i in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        func()
+        size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'first': times[0], 'best': min(times), 'peak_bytes': peak}
+
+
+def run(sizes, *, repeat, seed, end_year):
+    """Run the benchmarks; return the report"""
+    report = {
+        'meta': {
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+            'end_year': end_year,
+        },
+        'results': [],
+    }
+    for num_events in sizes:
+        data_sizes = Sizes.for_events(num_events)
+        print(f'{num_events} events: {data_sizes}', file=sys.stderr)
+        with tempfile.TemporaryDirectory() as tempdir:
+            datadir = Path(tempdir) / 'data'
+            generate_data(datadir, data_sizes, seed=seed, end_year=end_year)
+            results = {}
+            for name, func, reset in stages(datadir):
+                results[name] = measure(func, repeat, reset)
+                print(
+                    f'  {name:16} {results[name]["best"]*1000:10.2f}ms'
+                    f' {results[name]["peak_bytes"]/1024:10.0f}kB',
+                    file=sys.stderr,
+                )
+        report['results'].append({'events': num_events, 'stages': results})
+    return report
+
+
+def compare(old, new, threshold):
+    """Print ratios of best times; return True if none is over threshold"""
+    old_results = {r['events']: r['stages'] for r in old['results']}
+    ok = True
+    print(f'{"events":>7} {"stage":16} {"old":>10} {"new":>10} {"ratio":>6}')
+    for result in new['results']:
+        old_stages = old_results.get(result['events'], {})
+        for name, timing in result['stages'].items():
+            if name not in old_stages:
+                continue
+            old_best = old_stages[name]['best']
+            ratio = timing['best'] / old_best
+            flag = ''
+            if ratio > threshold:
+                flag = ' regression'
+                ok = False
+            print(
+                f'{result["events"]:7} {name:16} {old_best*1000:8.2f}ms'
+                f' {timing["best"]*1000:8.2f}ms {ratio:6.2f}{flag}'
+            )
+    return ok
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=Path(__file__).parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    if arguments['compare']:
+        with open(arguments['<old.json>']) as f:
+            old = json.load(f)
+        with open(arguments['<new.json>']) as f:
+            new = json.load(f)
+        if not compare(old, new, float(arguments['--threshold'])):
+            raise SystemExit(1)
+        return
+
+    report = run(
+        [int(n) for n in arguments['--sizes'].split(',')],
+        repeat=int(arguments['--repeat']),
+        seed=int(arguments['--seed']),
+        end_year=int(arguments['--end-year']),
+    )
+    output = json.dumps(report, indent=2)
+    if arguments['--out']:
+        with open(arguments['--out'], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Generate synthetic meetup data for benchmarks
+
+Usage:
+  synthetic.py --out=DIR [options]
+
+Options:
+  --out=DIR     Directory to write the data to (must not exist)
+  --events=N    Total number of events [default: 1000]
+  --seed=N      Seed for the random generator [default: 0]
+  --end-year=Y  Year before the year of the last events
+                (the current year if not given)
+
+The data has the layout of pyvo-data (meta.yaml, cities/*/city.yaml,
+cities/*/venues/*.yaml, series/*/series.yaml, series/*/events/*.yaml).
+Numbers of cities, venues and series grow with the number of events
+(see Sizes.for_events). The same arguments always give the same data.
+Each series has monthly events; the last ones are in January after
+the end year.
+"""
+
+from pathlib import Path
+import datetime
+import random
+
+import attr
+from attr import attrs
+import docopt
+import yaml
+
+
+FIRST_NAMES = [
+    'Petr', 'Jana', 'Tomáš', 'Lucie', 'Jiří', 'Kateřina', 'Martin', 'Eva',
+    'Ondřej', 'Zuzana', 'Michal', 'Tereza', 'Václav', 'Markéta', 'Honza',
+]
+LAST_NAMES = [
+    'Novák', 'Dvořák', 'Černý', 'Procházka', 'Kučera', 'Veselý', 'Horák',
+    'Němec', 'Marek', 'Pokorný', 'Růžička', 'Beneš', 'Fiala', 'Šťastný',
+]
+WORDS = [
+    'Python', 'Django', 'Flask', 'asyncio', 'typování', 'testování',
+    'databáze', 'data', 'vědecké', 'výpočty', 'web', 'API', 'knihovna',
+    'nasazení', 'Docker', 'výkon', 'paměť', 'profilování', 'grafy',
+    'strojové', 'učení', 'začátečníci', 'komunita', 'dokumentace', 'Rust',
+    'rozšíření', 'balíčky', 'bezpečnost', 'mikrokontroléry', 'hry',
+]
+MARKDOWN_SNIPPETS = [
+    'Přednáška o **{}** a o tom, jak s tím začít.',
+    'Ukážeme si *{}* v praxi:\n\n- příklady\n- chyby\n- [odkazy](https://example.com/)',
+    'Jak na {}? Přijďte se podívat.',
+]
+COVERAGE_KINDS = ['slides', 'code', 'writeup', 'link']
+
+
+@attrs(auto_attribs=True, frozen=True)
+class Sizes:
+    """Numbers of objects to generate"""
+    cities: int
+    venues_per_city: int
+    series: int
+    events: int
+    talks_per_event: int = 3
+
+    @classmethod
+    def for_events(cls, events):
+        """Sizes with the given number of events, and matching other sizes"""
+        series = max(1, events // 100)
+        return cls(
+            cities=max(1, series // 2),
+            venues_per_city=3,
+            series=series,
+            events=events,
+        )
+
+
+def generate_data(out, sizes, *, seed=0, end_year=None):
+    """Write synthetic data of the given Sizes to the directory `out`
+
+    `end_year` defaults to the current year.
+    """
+    if end_year is None:
+        end_year = datetime.date.today().year
+    rng = random.Random(seed)
+    out = Path(out)
+    out.mkdir(parents=True)
+    _dump(out / 'meta.yaml', {'version': 2, 'ignored_files': ['README.md']})
+
+    city_slugs = []
+    venue_slugs = {}
+    for c in range(sizes.cities):
+        slug = f'mesto-{c}'
+        city_slugs.append(slug)
+        location = _location(rng)
+        _dump(out / 'cities' / slug / 'city.yaml', {
+            'name': f'Město {c}',
+            'location': location,
+        })
+        venue_slugs[slug] = []
+        for v in range(sizes.venues_per_city):
+            venue_slug = f'hospoda-{c}-{v}'
+            venue_slugs[slug].append(venue_slug)
+            _dump(out / 'cities' / slug / 'venues' / f'{venue_slug}.yaml', {
+                'name': f'Hospoda {v} ({c})',
+                'city': slug,
+                'address': f'Ulice {v}\n{c}00 00 Město {c}',
+                'location': _location(rng),
+                'notes': rng.choice([None, 'Vchod *ze dvora*.']),
+            })
+
+    speakers = [
+        f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES
+    ]
+    # Index (year * 12 + month - 1) of the month of the last events
+    last_month = (end_year + 1) * 12
+    for s in range(sizes.series):
+        series_slug = f'pyvo-{s}'
+        city = city_slugs[s % len(city_slugs)]
+        name = f'Pyvo {s}'
+        _dump(out / 'series' / series_slug / 'series.yaml', {
+            'name': name,
+            'city': city,
+            'description': {
+                'cs': f'Sraz *Pythonistů* č. {s}',
+                'en': f'*Pythonista* meetup no. {s}',
+            },
+            'organizer-info': [
+                {'name': f'Organizátor {s}', 'mail': f'org{s}@example.com'},
+            ],
+            'recurrence': {
+                'rrule': 'RRULE:FREQ=MONTHLY;BYDAY=+3TH',
+                'scheme': 'monthly',
+                'description': {'cs': 'třetí čtvrtek', 'en': 'third Thursday'},
+            },
+        })
+
+        # Events are monthly, ending with last_month
+        num_events = sizes.events // sizes.series
+        if s < sizes.events % sizes.series:
+            num_events += 1
+        for number in range(1, num_events + 1):
+            year, month = divmod(last_month - num_events + number, 12)
+            date = _third_thursday(year, month + 1)
+            topic = ' '.join(rng.sample(WORDS, 2))
+            event = {
+                'name': name,
+                'city': city,
+                'number': number,
+                'topic': topic,
+                'start': datetime.datetime.combine(date, datetime.time(19)),
+                'venue': rng.choice(venue_slugs[city]),
+                'description': rng.choice(MARKDOWN_SNIPPETS).format(topic),
+                'talks': [
+                    _talk(rng, speakers)
+                    for t in range(rng.randint(0, sizes.talks_per_event * 2))
+                ],
+            }
+            file_slug = topic.split()[0].lower()
+            _dump(
+                out / 'series' / series_slug / 'events'
+                / f'{date.isoformat()}-{file_slug}.yaml',
+                event,
+            )
+
+
+def _talk(rng, speakers):
+    title = ' '.join(rng.sample(WORDS, rng.randint(2, 5))).capitalize()
+    talk = {
+        'title': title,
+        'speakers': rng.sample(speakers, rng.choice([1, 1, 1, 2])),
+        'description': rng.choice(MARKDOWN_SNIPPETS).format(title),
+    }
+    if rng.random() < 0.2:
+        talk['lightning'] = True
+    coverage = []
+    if rng.random() < 0.6:
+        video_id = ''.join(rng.choices('abcdefghijkABCDEFGHIJK0123456789', k=11))
+        coverage.append({'video': f'https://www.youtube.com/watch?v={video_id}'})
+    for kind in rng.sample(COVERAGE_KINDS, rng.randint(0, 2)):
+        coverage.append({kind: f'https://example.com/{kind}/{rng.randrange(10**6)}'})
+    if coverage:
+        talk['coverage'] = coverage
+    return talk
+
+
+def _location(rng):
+    return {
+        'latitude': f'{rng.uniform(48.6, 51):.4f}',
+        'longitude': f'{rng.uniform(12.1, 18.8):.4f}',
+    }
+
+
+def _third_thursday(year, month):
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(3 - first.weekday()) % 7 + 14)
+
+
+def _dump(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if v is not None}
+    with path.open('w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+
+
+def main():
+    arguments = docopt.docopt(__doc__)
+    sizes = Sizes.for_events(int(arguments['--events']))
+    end_year = arguments['--end-year']
+    generate_data(
+        arguments['--out'], sizes, seed=int(arguments['--seed']),
+        end_year=None if end_year is None else int(end_year),
+    )
+    print(attr.asdict(sizes))
+
+
+if __name__ == '__main__':
+    main()
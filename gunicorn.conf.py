@@ -0,0 +1,32 @@
+"""
+Configuration for serving pyvo.cz with Gunicorn in pre-fork mode.
+
+The app (see app.py) is created once, in the master process, and
+worker processes share the loaded data; see pyvocz/prefork.py.
+Install Gunicorn with `pip install -e ".[prefork]"`, then run:
+
+    gunicorn -c gunicorn.conf.py
+
+When the reload hook changes the data, the master loads the new data and
+replaces the workers. `kill -HUP <master pid>` does the same.
+"""
+
+from pyvocz import prefork
+
+
+wsgi_app = 'app:application'
+bind = '0.0.0.0:8000'
+workers = 4
+preload_app = True
+
+
+def on_starting(server):
+    prefork.enable(server.app.wsgi())
+
+
+def pre_fork(server, worker):
+    prefork.freeze()
+
+
+def on_reload(server):
+    prefork.reload_data(server.app.wsgi())
@@ -1,7 +1,11 @@
 """
-Serve the pyvo.cz website
+Serve the pyvo.cz website, or export it as static files
 
-Usage: pyvocz [options]
+Usage:
+  pyvocz [options]
+  pyvocz export --out=DIR [options]
+  pyvocz memory-report [options]
+  pyvocz startup-report [options]
 
 Options:
   --debug       Run in debug mode
@@ -10,10 +14,43 @@ Options:
   --port=PORT   Port to serve on
   --pull-password=PWD
                 Password for Git pull webhook
+  --snapshot=FILE
+                Cache loaded data in the given file, and load it from there
+                if the data directory did not change
+  --load-workers=N
+                Parse data files in N processes
+  --no-validate
+                Don't type-check data when loading it at startup
+  --watch       Reload data when files in the data directory change
+  --lazy-events=N
+                Load details of events (talks etc.) only when needed,
+                and keep at most N of them in memory
+  --cache-dir=DIR
+                Directory for caches shared between processes
+  --metrics     Time requests; serve the timings at /_metrics
+  --warm-up     Compile templates and render common pages before serving
+  --qrcodes     Generate QR codes of events at startup (and after reloads),
+                and show them on event pages
+
+Export options:
+  --out=DIR     Directory to export the static site to
+  --base-url=URL
+                URL the exported site will be served at
+                [default: https://pyvo.cz]
+  --jobs=N      Render pages in N processes
+  --full        Render all pages, even ones whose inputs did not change
+
+The memory-report command loads the data and prints how much memory
+the objects of each model class use.
+
+The startup-report command prints how long importing the app takes
+(by package), and how long it takes to create the app with the given
+options.
 
 If the data directory does not exists, clones a default repo into it.
 """
 
+import logging
 import os
 import subprocess
 
@@ -29,16 +66,81 @@ datadir = arguments['--data'] or DEFAULT_DATA_DIR
 pull_password = arguments['--pull-password']
 port = int(arguments['--port'] or 5000)
 host = arguments['--host']
+snapshot = arguments['--snapshot']
+load_workers = int(arguments['--load-workers'] or 1)
+cache_dir = arguments['--cache-dir']
+config = {
+    'PYVO_VALIDATE_DATA': not arguments['--no-validate'],
+    'PYVO_METRICS': arguments['--metrics'],
+    'PYVO_WARM_UP': arguments['--warm-up'],
+    'PYVO_PREGENERATE_QRCODES': arguments['--qrcodes'],
+    'PYVO_LAZY_EVENT_BODIES': (
+        int(arguments['--lazy-events']) if arguments['--lazy-events']
+        else None
+    ),
+}
 
 if not os.path.exists(datadir):
     subprocess.check_call(['git', 'clone',
                            'https://github.com/pyvec/pyvo-data', datadir])
 
+if arguments['export']:
+    from pyvocz.export import export_site
+
+    logging.basicConfig(level=logging.INFO)
+    export_site(
+        arguments['--out'], datadir=datadir, snapshot=snapshot,
+        load_workers=load_workers,
+        base_url=arguments['--base-url'],
+        jobs=int(arguments['--jobs'] or 1),
+        full=arguments['--full'],
+    )
+    raise SystemExit()
+
+if arguments['memory-report']:
+    from pyvocz.data import load_data
+    from pyvocz.memory import memory_report, format_memory_report
+
+    db = load_data(
+        datadir, snapshot=snapshot, workers=load_workers,
+        validate=config['PYVO_VALIDATE_DATA'],
+        lazy_bodies=config['PYVO_LAZY_EVENT_BODIES'],
+    )
+    print(format_memory_report(memory_report(db)))
+    raise SystemExit()
+
+if arguments['startup-report']:
+    import time
+    from pyvocz.startup import import_report, format_startup_report
+
+    report = import_report()
+    start = time.perf_counter()
+    create_app(datadir=datadir, pull_password=pull_password,
+               host=host, port=port, snapshot=snapshot,
+               load_workers=load_workers, cache_dir=cache_dir,
+               config=config)
+    create_time = time.perf_counter() - start
+    print(format_startup_report(report, create_time=create_time))
+    raise SystemExit()
+
 app = create_app(datadir=datadir, pull_password=pull_password,
-                 host=host, port=port)
+                 host=host, port=port, snapshot=snapshot,
+                 load_workers=load_workers, cache_dir=cache_dir,
+                 config=config)
+
+if arguments['--watch'] and (
+    # In debug mode, only watch in the child process started by the
+    # code reloader, which is the one that serves requests
+    not arguments['--debug'] or os.environ.get('WERKZEUG_RUN_MAIN')
+):
+    from pyvocz.watch import start_watching
+
+    logging.basicConfig(level=logging.INFO)
+    start_watching(app)
 
 if arguments['--debug']:
     app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.config['PYVO_PAGE_CACHE'] = False
     # Workaround for https://github.com/pallets/flask/issues/1907
     app.jinja_env.auto_reload = True
     app.run(debug=True, host=host, port=port)
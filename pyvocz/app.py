@@ -1,38 +1,116 @@
 import os
 from urllib.parse import urlparse, urlunparse
-import binascii
 import datetime
+import hashlib
 
 from flask import Flask, g, url_for, redirect, request
-from jinja2 import StrictUndefined
+from jinja2 import StrictUndefined, FileSystemBytecodeCache
 
 from . import filters
-from .views import routes
+from .views import routes, pregenerate_qrcodes
 from .data import load_data
+from .caches import make_cache
+from .reload import Reloader
+from .search import get_search_index
+from .metrics import init_metrics
+from .warmup import warm_up
 
 DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), 'pyvo-data')
 
 
 def create_app(datadir=DEFAULT_DATA_DIR, echo=True, pull_password=None,
-               host=None, port=5000):
+               host=None, port=5000, snapshot=None, load_workers=None,
+               cache_dir=None, config=None):
     datadir = os.path.abspath(datadir)
+    if snapshot is not None:
+        snapshot = os.path.abspath(snapshot)
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
 
     app = Flask(__name__)
+    app.config.update(config or {})
     app.config.setdefault('PYVO_DATADIR', datadir)
     app.config.setdefault('PYVO_PULL_PASSWORD', pull_password)
+    app.config.setdefault('PYVO_SNAPSHOT', snapshot)
+    app.config.setdefault('PYVO_LOAD_WORKERS', load_workers)
+    # Type-check data when loading it (data changed by the reload hook
+    # is always checked). Snapshots of data that wasn't checked are only
+    # used when this is off.
+    app.config.setdefault('PYVO_VALIDATE_DATA', True)
+    # If set to a number N, details of events are loaded lazily,
+    # and at most N of them are kept in memory
+    app.config.setdefault('PYVO_LAZY_EVENT_BODIES', None)
+    app.config.setdefault('PYVO_PAGE_CACHE', True)
+    app.config.setdefault('PYVO_PAGE_CACHE_BYTES', 64 * 2**20)
+    app.config.setdefault('PYVO_CACHE_DIR', cache_dir)
+    app.config.setdefault('PYVO_QRCODE_CACHE_BYTES', 16 * 2**20)
+    # QR codes are never generated while handling requests. They can be
+    # generated for all events on startup and after each data reload
+    # (which takes a while, so it's off by default).
+    app.config.setdefault('PYVO_PREGENERATE_QRCODES', False)
+    # Show QR codes on event pages (they need to be pregenerated)
+    app.config.setdefault(
+        'PYVO_QRCODES', app.config['PYVO_PREGENERATE_QRCODES'],
+    )
+    # Link to the search page from all pages (search is only available
+    # with the app running, not in the static export)
+    app.config.setdefault('PYVO_SEARCH', True)
+    # Compiled templates, shared between processes; see pyvocz.warmup
+    if cache_dir is None:
+        template_cache_dir = None
+    else:
+        template_cache_dir = os.path.join(cache_dir, 'templates')
+    app.config.setdefault('PYVO_TEMPLATE_CACHE_DIR', template_cache_dir)
+    # Compile templates and render common pages before serving requests,
+    # and after each data reload
+    app.config.setdefault('PYVO_WARM_UP', False)
+    # Measure where time goes in requests; see pyvocz.metrics
+    app.config.setdefault('PYVO_METRICS', False)
     app.config.setdefault('PROPAGATE_EXCEPTIONS', True)
 
-    app.db = load_data(datadir)
+    app.db = load_data(
+        datadir, snapshot=snapshot, workers=load_workers,
+        validate=app.config['PYVO_VALIDATE_DATA'],
+        lazy_bodies=app.config['PYVO_LAZY_EVENT_BODIES'],
+    )
+    get_search_index(app.db)
+
+    # Rendered pages; see views.cached_page
+    app.page_cache = make_cache(app.config['PYVO_PAGE_CACHE_BYTES'])
+
+    # QR code images, which don't depend on the data; these can be shared
+    # between processes using a cache directory
+    if cache_dir is None:
+        qrcode_cache_dir = None
+    else:
+        qrcode_cache_dir = os.path.join(cache_dir, 'qrcodes')
+    app.qrcode_cache = make_cache(
+        app.config['PYVO_QRCODE_CACHE_BYTES'], qrcode_cache_dir,
+    )
 
     if host:
         server_name = host
         if port != 80:
             server_name += ':{}'.format(port)
         app.config['SERVER_NAME'] = server_name
+        base_url = f"{app.config['PREFERRED_URL_SCHEME']}://{server_name}"
+    else:
+        base_url = f'http://localhost:{port}'
+    # URL of the site, for absolute URLs built outside of requests
+    # (like the ones in QR codes)
+    app.config.setdefault('PYVO_BASE_URL', base_url)
     app.jinja_env.undefined = StrictUndefined
+    if app.config['PYVO_TEMPLATE_CACHE_DIR'] is not None:
+        os.makedirs(app.config['PYVO_TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            app.config['PYVO_TEMPLATE_CACHE_DIR'],
+        )
     app.jinja_env.globals['get_today'] = datetime.date.today
 
-    tag = binascii.hexlify(os.urandom(16))
+    # The tag changes with the stylesheet, so browsers don't use an old one.
+    # It's the same in all processes, so pages have the same ETags.
+    with open(os.path.join(app.static_folder, 'style.css'), 'rb') as f:
+        tag = hashlib.sha1(f.read()).hexdigest()[:16]
     app.jinja_env.globals['_static_cache_tag'] = tag
 
     for filter_name in filters.__all__:
@@ -56,6 +134,8 @@ def create_app(datadir=DEFAULT_DATA_DIR, echo=True, pull_password=None,
     def pull_lang_code(endpoint, values):
         if values:
             g.lang_code = values.pop('lang_code', None)
+        else:
+            g.lang_code = None
 
     @app.url_defaults
     def add_language_code(endpoint, values):
@@ -73,7 +153,19 @@ def create_app(datadir=DEFAULT_DATA_DIR, echo=True, pull_password=None,
             url = urlunparse((scheme, netloc, path, params, query, fragment))
             return redirect(url)
 
+    init_metrics(app)
+
     for url, func, options in routes:
         app.route(url, **options)(func)
 
+    # Background reloading of data; see pyvocz.reload
+    app.reloader = Reloader(app)
+    app.before_request(app.reloader.check_generation)
+
+    if app.config['PYVO_PREGENERATE_QRCODES']:
+        pregenerate_qrcodes(app)
+
+    if app.config['PYVO_WARM_UP']:
+        warm_up(app)
+
     return app
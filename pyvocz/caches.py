@@ -0,0 +1,180 @@
+"""Caches of rendered content
+
+All caches here store immutable `bytes` under string keys, and have
+the same interface:
+
+- get(key) returns the stored bytes, or None if the key is not cached,
+- set(key, value) stores a value,
+- clear() removes all values.
+
+MemoryCache is private to a process. FileCache is stored in a directory,
+so it can be shared by all worker processes (and survives restarts).
+The operating system's page cache keeps frequently used files in memory.
+"""
+
+from pathlib import Path
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+class MemoryCache:
+    """In-process LRU cache limited by the total size of stored values"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        value = bytes(value)
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                key, old = self._data.popitem(last=False)
+                self._size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class FileCache:
+    """Cache stored as files in a directory
+
+    Values are written atomically, so concurrent readers (in any process)
+    see either a complete value or none at all.
+
+    If `max_bytes` is given, the oldest files are removed when the total
+    size of the files exceeds it. (Processes sharing the directory only
+    know their own writes, so the limit can be exceeded until one of them
+    rescans the directory.)
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Total size of the files; computed on the first `set`
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.directory / digest[:2] / digest[2:]
+
+    def get(self, key):
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._size is None:
+                    self._size = sum(size for p, size, mtime in self._files())
+                else:
+                    self._size += len(value)
+                if self._size > self.max_bytes:
+                    self._prune(keep=path)
+
+    def _files(self):
+        """Yield (path, size, mtime) of all the cached files"""
+        for path in self.directory.glob('*/*'):
+            if path.suffix == '.tmp':
+                # Being written
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime_ns
+
+    def _prune(self, keep):
+        # Called with the lock held.
+        # Remove the oldest files (except `keep`, which was just written),
+        # leaving some room for new ones
+        files = sorted(self._files(), key=lambda file: file[2])
+        self._size = sum(size for path, size, mtime in files)
+        for path, size, mtime in files:
+            if self._size <= self.max_bytes * 3 // 4:
+                break
+            if path != keep:
+                path.unlink(missing_ok=True)
+                self._size -= size
+
+    def clear(self):
+        for child in self.directory.iterdir():
+            shutil.rmtree(child, ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+
+class ChainCache:
+    """Several caches, from fastest to slowest
+
+    Values found in a slower cache are copied to the faster ones.
+    """
+
+    def __init__(self, *caches):
+        self.caches = caches
+
+    def get(self, key):
+        for i, cache in enumerate(self.caches):
+            value = cache.get(key)
+            if value is not None:
+                for faster_cache in self.caches[:i]:
+                    faster_cache.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for cache in self.caches:
+            cache.set(key, value)
+
+    def clear(self):
+        for cache in self.caches:
+            cache.clear()
+
+
+def make_cache(max_bytes, directory=None):
+    """Make an in-memory cache, backed by a directory if one is given
+
+    Both the memory and the directory hold at most `max_bytes`.
+    """
+    cache = MemoryCache(max_bytes)
+    if directory is None:
+        return cache
+    return ChainCache(cache, FileCache(directory, max_bytes))
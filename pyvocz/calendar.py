@@ -1,12 +1,21 @@
 import datetime
 import collections
+import functools
+import threading
 
-from czech_holidays import Holidays
 from dateutil.relativedelta import relativedelta
 
+from .metrics import timed
+
 DAY = datetime.timedelta(days=1)
 WEEK = DAY * 7
 firstweekday=None
+
+# Maximum number of finished month grids to remember
+MAX_CACHED_MONTHS = 512
+
+
+@timed('calendar')
 def get_calendar(
     db, first_year=None, first_month=None, num_months=3, series_slugs=None,
 ):
@@ -21,51 +30,154 @@ def get_calendar(
         first_month -= 12
         first_year += 1
 
-    next_occurences = collections.defaultdict(list)
+    if series_slugs is None:
+        series_slugs = db.series
+    series_slugs = frozenset(s for s in series_slugs if s in db.series)
+
+    calendar_data = get_calendar_data(db)
 
     start = datetime.date(year=first_year, month=first_month, day=1)
     end = start + relativedelta(months=num_months)
 
-    if series_slugs is None:
-        series_slugs = list(db.series)
-    for series_slug in series_slugs:
-        series = db.series.get(series_slug)
-        if not series:
-            continue
-        next_occurrences = series.next_occurrences()
-        zero_time = datetime.time(tzinfo=db.default_timezone)
-        start_date = datetime.datetime.combine(start, zero_time)
-        end_date = datetime.datetime.combine(end+relativedelta(days=1),
-                                                zero_time)
-        between = getattr(next_occurrences, 'between', None)
-        if between:
-            occurences = between(start_date, end_date, inc=True)
-            for occurence in occurences:
-                next_occurences[occurence.date()].append(series)
-
-    events = collections.defaultdict(list)
-    for event in db.events:
-        if series_slugs is not None and event.series.slug not in series_slugs:
-            continue
-        if event.date >= start and event.date < end:
-            events[event.date].append(event)
-
     months = collections.OrderedDict()
     now = start
     while now < end:
-        months[now.year, now.month] = get_month(now.year, now.month, events,
-                                                next_occurences)
+        months[now.year, now.month] = calendar_data.get_month(
+            now.year, now.month, series_slugs, start=start, end=end,
+        )
         now += relativedelta(months=1)
 
     return months
 
-def get_month(year, month, events, next_occurences=None):
-    holidays = {h: h for h in Holidays(year)}
-    def mkday(day):
-        alien = (day.month != month)
-        return get_day(day, events=events, holidays=holidays, alien=alien,
-                       next_occurences=next_occurences)
 
+@functools.lru_cache()
+def get_holidays(year):
+    """Return Czech holidays in the given year, as a dict keyed by date"""
+    from czech_holidays import Holidays
+
+    return {h: h for h in Holidays(year)}
+
+
+class CalendarData:
+    """Precomputed calendar information for one version of the data
+
+    Finished month grids are memoized, so once warm, rendering a calendar
+    only costs a dict lookup per month.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        # Planned occurrences of recurring series: year -> date -> [series]
+        self._occurrences = {}
+        # Events of subsets of all series: frozenset of slugs -> date -> [event]
+        self._filtered_events = {}
+        # Month grids: (year, month, frozenset of slugs) -> weeks
+        self._months = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_month(self, year, month, series_slugs, *, start, end):
+        """Return the grid of weeks for a month, for the given series
+
+        The grid only shows events and planned occurrences from `start`
+        to `end` (exclusive).
+        (A grid also shows days of the adjacent months, which may be
+        outside the range of a calendar.)
+        """
+        first, last = _grid_bounds(year, month)
+        # Only the part of the range that the grid shows affects it,
+        # so grids of months inside a range are shared by all ranges
+        start = max(start, first)
+        end = min(end, last)
+        key = year, month, series_slugs, start, end
+        with self._lock:
+            try:
+                self._months.move_to_end(key)
+                return self._months[key]
+            except KeyError:
+                pass
+        events = self._events(series_slugs)
+        occurrences = self._next_occurrences(year, month, series_slugs)
+        weeks = get_month(
+            year, month,
+            events={
+                day: events[day] for day in _days(start, end)
+                if day in events
+            },
+            next_occurences={
+                day: occurrences[day] for day in _days(start, end)
+                if day in occurrences
+            },
+        )
+        with self._lock:
+            self._months[key] = weeks
+            while len(self._months) > MAX_CACHED_MONTHS:
+                self._months.popitem(last=False)
+        return weeks
+
+    def _events(self, series_slugs):
+        """Return events of the given series, as a dict keyed by date"""
+        events_by_date = self.db.events_by_date
+        if series_slugs == self.db.series.keys():
+            return events_by_date
+        with self._lock:
+            try:
+                return self._filtered_events[series_slugs]
+            except KeyError:
+                pass
+        result = {}
+        for day, events in events_by_date.items():
+            events = [e for e in events if e.series.slug in series_slugs]
+            if events:
+                result[day] = events
+        with self._lock:
+            return self._filtered_events.setdefault(series_slugs, result)
+
+    def _next_occurrences(self, year, month, series_slugs):
+        """Return planned occurrences of the given series around a month"""
+        # A month grid can show days of the adjacent years
+        occurrences = {}
+        for y in range(year - (month == 1), year + 1 + (month == 12)):
+            for day, series_list in self._year_occurrences(y).items():
+                occurrences[day] = [
+                    s for s in series_list if s.slug in series_slugs
+                ]
+        return occurrences
+
+    def _year_occurrences(self, year):
+        with self._lock:
+            try:
+                return self._occurrences[year]
+            except KeyError:
+                pass
+        tzinfo = self.db.default_timezone
+        start = datetime.datetime(year, 1, 1, tzinfo=tzinfo)
+        end = datetime.datetime(year + 1, 1, 1, tzinfo=tzinfo)
+        result = {}
+        for series in self.db.series.values():
+            for occurence in series.occurrences_between(start, end):
+                result.setdefault(occurence.date(), []).append(series)
+        with self._lock:
+            return self._occurrences.setdefault(year, result)
+
+
+_calendar_data = None
+_calendar_data_lock = threading.Lock()
+
+
+def get_calendar_data(db):
+    """Return CalendarData for the given data, creating it if needed
+
+    Only the CalendarData for the most recently used `db` is kept.
+    """
+    global _calendar_data
+    with _calendar_data_lock:
+        if _calendar_data is None or _calendar_data.db is not db:
+            _calendar_data = CalendarData(db)
+        return _calendar_data
+
+
+def _grid_bounds(year, month):
+    """Return the first day of a month's grid, and the day after the last"""
     first_of_month = datetime.date(year, month, 1)
     first = first_of_month - DAY * first_of_month.weekday()
 
@@ -76,6 +188,26 @@ def get_month(year, month, events, next_occurences=None):
     while (last - first) < 6 * WEEK:
         last += WEEK
 
+    return first, last
+
+
+def _days(start, end):
+    """Iterate over days from `start` to `end` (exclusive)"""
+    day = start
+    while day < end:
+        yield day
+        day += DAY
+
+
+def get_month(year, month, events, next_occurences=None):
+    holidays = get_holidays(year)
+    def mkday(day):
+        alien = (day.month != month)
+        return get_day(day, events=events, holidays=holidays, alien=alien,
+                       next_occurences=next_occurences)
+
+    first, last = _grid_bounds(year, month)
+
     week = []
     weeks = []
     current = first
@@ -92,7 +224,7 @@ def get_month(year, month, events, next_occurences=None):
 def get_day(day, events, holidays, next_occurences=None, *, alien=False):
     return {
         'day': day,
-        'events': events[day],
+        'events': events.get(day, []),
         'holiday': holidays.get(day),
         'weekend': day.weekday() >= 5,
         'next_occurences': next_occurences.get(day) if next_occurences else [],
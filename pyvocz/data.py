@@ -1,19 +1,41 @@
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import logging
+import os
 import re
+import sys
+import time
+import threading
+import bisect
 from urllib.parse import urlparse
 import itertools
+import weakref
 
 import attr
 from  attr import attrs
 import yaml
 from dateutil import tz, rrule, relativedelta
+from markupsafe import Markup
 
 from .typecheck import typecheck
+from .markup import render_texts
+from .snapshot import load_snapshot, save_snapshot, manifest_digest
 
 
+logger = logging.getLogger(__name__)
+
+# Use the fast libyaml-based loader if it's available
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 CET = tz.gettz('Europe/Prague')
+
+# Length of the period for which planned occurrences of a series are
+# precomputed
+RECURRENCE_WINDOW = relativedelta.relativedelta(months=24)
 YOUTUBE_RE = re.compile(r'''(?x)https?://
                         (?:
                             (?:www\.youtube\.com/watch\?v=)|
@@ -21,29 +43,376 @@ YOUTUBE_RE = re.compile(r'''(?x)https?://
                         )
                         ([-0-9a-zA-Z_]+)''')
 
-def load_data(datadir):
+def load_data(datadir, *, snapshot=None, workers=None, validate=True,
+              lazy_bodies=None):
+    """Load data from the given directory
+
+    If `snapshot` is given, it names a snapshot file (see pyvocz.snapshot).
+    If the snapshot is up to date, data is loaded from it instead of the
+    YAML files. Otherwise the snapshot is rewritten after loading.
+
+    If `workers` is greater than 1, YAML files are parsed in a pool
+    of that many processes.
+
+    If `validate` is false, the loaded data is not type-checked.
+    (Data loaded from a snapshot is never type-checked again, so with
+    `validate`, snapshots of data that was not checked are not used.)
+
+    If `lazy_bodies` is given, details of events (descriptions, talks and
+    links) are only loaded when they're needed, and at most `lazy_bodies`
+    of them are kept in memory. See EventBodies.
+
+    Timings of the individual loading phases are logged.
+    """
+    path = Path(datadir)
+    timings = {}
+    with _timed(timings, 'walk'):
+        meta = load_meta(path)
+        tree = _walk(path, meta.ignored_files)
+        files = list(_files(tree))
+        manifest = _manifest(path, files)
+
+    if snapshot is not None:
+        with _timed(timings, 'snapshot'):
+            root = load_snapshot(snapshot, manifest, validated=validate)
+        if root is not None and (
+            (root.event_bodies is None) == (lazy_bodies is None)
+        ):
+            if lazy_bodies is not None:
+                root.event_bodies.max_bodies = lazy_bodies
+            _log_timings(path, timings)
+            return root
+
+    with _timed(timings, 'parse'):
+        data = _dict_from_tree(tree, path, workers=workers)
+    if lazy_bodies is None:
+        event_bodies = None
+    else:
+        event_bodies = EventBodies(path.resolve(), lazy_bodies)
+    with _timed(timings, 'build'):
+        root = Root.load(data, validate=False, event_bodies=event_bodies)
+    if validate:
+        with _timed(timings, 'typecheck'):
+            typecheck(root)
+        root.validated = True
+    _unload_bodies(root.events)
+    with _timed(timings, 'markdown'):
+        render_markdown_fields(root, workers=workers)
+    root.set_manifest(manifest)
+
+    if snapshot is not None:
+        with _timed(timings, 'save'):
+            save_snapshot(snapshot, root, manifest)
+    _log_timings(path, timings)
+    return root
+
+
+@contextlib.contextmanager
+def _timed(timings, phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def _log_timings(path, timings):
+    logger.info(
+        'Loaded data from %s in %.3fs (%s)',
+        path, sum(timings.values()),
+        ', '.join(f'{phase}: {t:.3f}s' for phase, t in timings.items()),
+    )
+
+
+def update_data(root, datadir, changed_paths, *, snapshot=None, workers=None,
+                validate=True, lazy_bodies=None):
+    """Return data from `root` with changes to the given files applied
+
+    `changed_paths` are names of added, modified or removed files, relative
+    to `datadir`. Only these files (and the rest of any city they belong to)
+    are re-read. Series and events that did not change are shared with
+    `root`.
+
+    `root` is not modified, so it can be used while the update runs.
+    Shared objects whose back-references (like `Event.series`) would
+    change are copied instead.
+
+    Changes that can't be applied incrementally, like changes to meta.yaml,
+    cause a full reload with load_data, which gets the remaining arguments.
+    The changed files are always type-checked.
+    """
     path = Path(datadir)
-    with (path / 'meta.yaml').open() as f:
-        meta = Meta(**yaml.safe_load(f))
-    data = dict_from_path(path, path, exclude=meta.ignored_files)
+    meta = load_meta(path)
+
+    changed_cities = set()
+    changed_series = {}
+    for name in changed_paths:
+        name = Path(name)
+        parts = name.parts
+        if parts[0] in meta.ignored_files:
+            continue
+        if any(part.startswith('.') for part in parts):
+            continue
+        if parts[0] == 'cities' and len(parts) > 2:
+            changed_cities.add(parts[1])
+        elif parts[0] == 'series' and len(parts) > 2:
+            changed_series.setdefault(parts[1], set()).add(name)
+        else:
+            return load_data(
+                datadir, snapshot=snapshot, workers=workers,
+                validate=validate, lazy_bodies=lazy_bodies,
+            )
+
+    cities = dict(root.cities)
+    for slug in changed_cities:
+        city_path = path / 'cities' / slug
+        if city_path.is_dir():
+            cities[slug] = City.load(dict_from_path(city_path, path), slug)
+        else:
+            cities.pop(slug, None)
+    venues = _venues_by_slug(cities)
+
+    # Copying events looks up their (possibly new) cities and venues;
+    # this fails on references to removed cities or venues
+    series = dict(root.series)
+    # Copies of events from `root`
+    kept_events = []
+    for slug, names in changed_series.items():
+        series_path = path / 'series' / slug
+        old_series = series.pop(slug, None)
+        if not (series_path / 'series.yaml').is_file():
+            continue
+        if old_series is None:
+            kept = []
+        else:
+            kept = [
+                _copy_event(e, cities=cities, venues=venues)
+                for e in old_series.events
+                if e._source not in names
+            ]
+        events_data = {}
+        for name in names:
+            if name.parts[2] == 'events' and (path / name).is_file():
+                events_data[name.stem] = dict_from_path(path / name, path)
+        data = {
+            'series': dict_from_path(series_path / 'series.yaml', path),
+            'events': events_data,
+        }
+        series[slug] = Series.load(
+            data, slug, cities=cities, venues=venues, extra_events=kept,
+            event_bodies=root.event_bodies,
+        )
+        for event in kept:
+            event.series = series[slug]
+        kept_events.extend(kept)
+
+    # Copy unchanged series that refer to changed cities or venues
+    if changed_cities:
+        for slug, the_series in series.items():
+            if slug not in changed_series and not _refs_current(
+                the_series, cities=cities, venues=venues,
+            ):
+                series[slug] = _copy_series(
+                    the_series, cities=cities, venues=venues,
+                )
+
+    self = Root.from_parts(
+        cities=cities, venues=venues, series=series,
+        event_bodies=root.event_bodies,
+    )
+    trusted = [c for c in cities.values() if c.slug not in changed_cities]
+    trusted.extend(s for s in series.values() if s.slug not in changed_series)
+    trusted.extend(kept_events)
+    typecheck(self, trusted=trusted)
+    # Unchanged objects were type-checked only if `root` was
+    self.validated = root.validated
+    for slug in changed_series:
+        if slug in series:
+            _unload_bodies(series[slug].events)
+    render_markdown_fields(self, workers=workers)
+
+    manifest = data_manifest(path, exclude=meta.ignored_files)
+    self.set_manifest(manifest)
+    if snapshot is not None:
+        save_snapshot(snapshot, self, manifest)
+    return self
+
+
+def _refs_current(series, *, cities, venues):
+    """Return true if a series only refers to the given cities and venues"""
+    if series.home_city is not cities.get(series.home_city.slug):
+        return False
+    for event in series.events:
+        if event.city is not cities.get(event.city.slug):
+            return False
+        if event.venue and event.venue is not venues.get(event.venue.slug):
+            return False
+    return True
+
+
+def _copy_series(series, *, cities, venues):
+    """Copy a series and its events, referring to the given cities & venues"""
+    events = [
+        _copy_event(e, cities=cities, venues=venues) for e in series.events
+    ]
+    result = attr.evolve(
+        series, events=events, home_city=cities[series.home_city.slug],
+    )
+    result.description_cs_html = series.description_cs_html
+    result.description_en_html = series.description_en_html
+    for event in events:
+        event.series = result
+    return result
+
+
+def _copy_event(event, *, cities, venues):
+    """Copy an event, referring to the given cities and venues
+
+    The copy's `series` is None; the caller is responsible for setting it.
+    """
+    if event.venue:
+        venue = venues[event.venue.slug]
+    else:
+        venue = None
+    result = attr.evolve(
+        event, city=cities[event.city.slug], venue=venue, series=None,
+        body=None, talk_summaries=None,
+    )
+    if event._lazy_bodies is None:
+        result._body = _copy_body(event._body, result)
+    else:
+        result._talk_summaries = [
+            attr.evolve(summary, event=result)
+            for summary in event._talk_summaries
+        ]
+        for summary in result._talk_summaries:
+            summary.videos = [
+                attr.evolve(link, talk=summary) for link in summary.videos
+            ]
+    return result
+
+
+def _copy_body(body, event):
+    """Copy an EventBody, with talks that belong to `event`"""
+    talks = []
+    for talk in body.talks:
+        links = [attr.evolve(link, talk=None) for link in talk.links]
+        new_talk = attr.evolve(talk, links=links, event=event)
+        new_talk.description_html = talk.description_html
+        for link in links:
+            link.talk = new_talk
+        talks.append(new_talk)
+    result = attr.evolve(body, talks=talks)
+    result.description_html = body.description_html
+    return result
+
+
+def load_meta(datadir):
+    """Load the metadata (meta.yaml) of a data directory"""
+    return Meta(**_parse_file(Path(datadir) / 'meta.yaml'))
+
+
+def data_manifest(path, *, exclude=()):
+    """Return a sorted list of (name, size, mtime) for all data files
+
+    The files are the same ones that dict_from_path loads.
+    """
+    path = Path(path)
+    return _manifest(path, _files(_walk(path, exclude)))
+
+
+def _manifest(base, files):
+    result = []
+    for file in files:
+        stat = file.stat()
+        result.append(
+            (file.relative_to(base).as_posix(), stat.st_size, stat.st_mtime_ns)
+        )
+    result.sort()
+    return result
 
-    return Root.load(data)
 
+def dict_from_path(path, base, *, exclude=(), workers=None):
+    """Load a file or directory tree as nested dicts
 
-def dict_from_path(path, base, *, exclude=()):
+    Each YAML file is loaded as a dict with an additional `_source` key,
+    which contains the path relative to `base`. A directory is loaded
+    as a dict with keys based on the file/subdirectory names (without
+    extensions).
+
+    If `workers` is greater than 1, files are parsed in a pool
+    of that many processes.
+    """
     if path.is_file():
-        with path.open() as f:
-            result = yaml.safe_load(f)
-            result['_source'] = path.relative_to(base)
-            return result
-    else:
-        result = {}
-        for child in Path(path).iterdir():
-            if child.name not in exclude and not child.name.startswith('.'):
-                result[child.stem] = dict_from_path(child, base)
+        [result] = parse_files([path], base)
         return result
+    else:
+        return _dict_from_tree(_walk(path, exclude), base, workers=workers)
+
+
+def _walk(path, exclude=()):
+    """Return the tree of data files in a directory
+
+    The result is a list of (path, children) pairs, where children is
+    a tree of the same form for directories, or None for files.
+    """
+    return [
+        (child, None if child.is_file() else _walk(child))
+        for child in path.iterdir()
+        if child.name not in exclude and not child.name.startswith('.')
+    ]
 
-@attrs(auto_attribs=True)
+
+def _files(tree):
+    """Iterate over all files in a tree returned by _walk"""
+    for child, children in tree:
+        if children is None:
+            yield child
+        else:
+            yield from _files(children)
+
+
+def _dict_from_tree(tree, base, *, workers=None):
+    files = list(_files(tree))
+    contents = dict(zip(files, parse_files(files, base, workers=workers)))
+
+    def _assemble(tree):
+        return {
+            child.stem: contents[child] if children is None
+                        else _assemble(children)
+            for child, children in tree
+        }
+
+    return _assemble(tree)
+
+
+def parse_files(paths, base, *, workers=None):
+    """Parse the given YAML files, and return a list of the results
+
+    `_source` is set on each result to the path relative to `base`.
+
+    If `workers` is greater than 1, files are parsed in a pool
+    of that many processes.
+    """
+    if workers is not None and workers > 1 and len(paths) > 1:
+        chunksize = max(1, len(paths) // (workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(
+                executor.map(_parse_file, paths, chunksize=chunksize)
+            )
+    else:
+        results = [_parse_file(path) for path in paths]
+    for path, result in zip(paths, results):
+        result['_source'] = path.relative_to(base)
+    return results
+
+
+def _parse_file(path):
+    with path.open('rb') as f:
+        return yaml.load(f, Loader=_YAML_LOADER)
+
+
+@attrs(auto_attribs=True, slots=True)
 class Meta:
     version: int
     ignored_files: List[Path]
@@ -71,6 +440,10 @@ class Venue:
 
     # Notes about the venue, e.g. directions to get there
     notes: Optional[str]
+    # `notes` converted to HTML, when the data is loaded
+    notes_html: Optional[Markup] = attr.ib(
+        default=None, init=False, repr=False,
+    )
 
     location: Location
     home_city: "City" = None
@@ -79,7 +452,7 @@ class Venue:
     def load(cls, data, slug):
         return cls(
             name=data['name'],
-            city=data['city'],
+            city=sys.intern(data['city']),
             slug=slug,
             address=data.get('address'),
             location=Location(**data['location']),
@@ -134,7 +507,19 @@ class City:
 class TalkLink:
     kind: Optional[str]
     url: str
-    talk: "Talk" = None
+    talk: Union["Talk", "TalkSummary"] = None
+
+    # Values parsed from `url`, computed when the link is created
+    hostname: Optional[str] = attr.ib(init=False, repr=False)
+    youtube_id: Optional[str] = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.hostname = urlparse(self.url).hostname
+        match = YOUTUBE_RE.match(self.url)
+        if match:
+            self.youtube_id = match.group(1)
+        else:
+            self.youtube_id = None
 
     @classmethod
     def load(cls, data):
@@ -142,30 +527,45 @@ class TalkLink:
             raise ValueError('coverage dict too long')
         for kind, url in data.items():
             return cls(
-                kind=kind,
+                kind=sys.intern(kind),
                 url=url,
             )
 
-    @property
-    def hostname(self):
-        return urlparse(self.url).hostname
-
-    @property
-    def youtube_id(self):
-        match = YOUTUBE_RE.match(self.url)
-        if match:
-            return match.group(1)
-
 
 @attrs(auto_attribs=True, slots=True)
 class Speaker:
     name: str
 
+    @classmethod
+    def get(cls, name):
+        """Return the Speaker of the given name
+
+        Speakers are interned: while a speaker is in use, all talks share
+        a single object for them.
+        """
+        name = sys.intern(name)
+        speaker = _speakers.get(name)
+        if speaker is None:
+            speaker = _speakers.setdefault(name, cls(name))
+        return speaker
+
+    def __reduce__(self):
+        # Intern speakers loaded from snapshots, too
+        return Speaker.get, (self.name,)
+
+
+# Interned speakers: name -> Speaker
+_speakers = weakref.WeakValueDictionary()
+
 
 @attrs(auto_attribs=True, slots=True)
 class Talk:
     title: str
     description: Optional[str]
+    # `description` converted to HTML, when the data is loaded
+    description_html: Optional[Markup] = attr.ib(
+        default=None, init=False, repr=False,
+    )
     links: List[TalkLink]
     speakers: List[Speaker]
 
@@ -174,12 +574,22 @@ class Talk:
 
     event: "Event" = None
 
+    # YouTube ID of the first link that has one, computed when the talk
+    # is created
+    youtube_id: Optional[str] = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.youtube_id = next(
+            (link.youtube_id for link in self.links if link.youtube_id),
+            None,
+        )
+
     @classmethod
     def load(cls, data):
         self = cls(
             title=data['title'],
             description=data.get('description'),
-            speakers=[Speaker(s) for s in data.get('speakers', ())],
+            speakers=[Speaker.get(s) for s in data.get('speakers', ())],
             links=
                 [TalkLink(None, c) for c in data.get('urls', [])] +
                 [TalkLink.load(c) for c in data.get('coverage', [])],
@@ -190,11 +600,41 @@ class Talk:
         return self
 
     @property
-    def youtube_id(self):
-        for link in self.links:
-            yid = link.youtube_id
-            if yid:
-                return yid
+    def videos(self):
+        """Links to videos of the talk"""
+        return [link for link in self.links if link.kind == 'video']
+
+
+@attrs(auto_attribs=True, slots=True)
+class TalkSummary:
+    """Parts of a talk that are kept when event details are loaded lazily
+
+    Indexes that cover all talks (like MediaIndex) use these, so that
+    they don't need to load details of all events.
+    """
+    title: str
+    speakers: List[Speaker]
+
+    # True if this is a lightning talk
+    is_lightning: bool
+
+    # Links to videos of the talk
+    videos: List[TalkLink]
+
+    event: "Event" = None
+
+    @classmethod
+    def from_talk(cls, talk):
+        self = cls(
+            title=talk.title,
+            speakers=talk.speakers,
+            is_lightning=talk.is_lightning,
+            videos=[attr.evolve(link, talk=None) for link in talk.videos],
+            event=talk.event,
+        )
+        for link in self.videos:
+            link.talk = self
+        return self
 
 
 @attrs(auto_attribs=True, slots=True)
@@ -202,6 +642,32 @@ class EventLink:
     url: str
 
 
+@attrs(auto_attribs=True, slots=True)
+class EventBody:
+    """Details of an event, which can be loaded lazily (see EventBodies)"""
+
+    # Description in Markdown format
+    description: Optional[str]
+    # `description` converted to HTML, when the data is loaded
+    description_html: Optional[Markup] = attr.ib(
+        default=None, init=False, repr=False,
+    )
+
+    talks: List[Talk]
+    links: List[EventLink]
+
+    @classmethod
+    def load(cls, data, event):
+        self = cls(
+            description=data.get('description'),
+            talks=[Talk.load(t) for t in data.get('talks', ())],
+            links=[EventLink(l) for l in data.get('urls', ())],
+        )
+        for talk in self.talks:
+            talk.event = event
+        return self
+
+
 @attrs(auto_attribs=True, slots=True)
 class Event:
     """An event."""
@@ -221,12 +687,7 @@ class Event:
     # City where the event takes place
     city: City
 
-    # Description in Markdown format
-    description: Optional[str]
-
     start: datetime.datetime
-    talks: List[Talk]
-    links: List[EventLink]
 
     # Path where the data was loaded from (relative to data directory root)
     _source: Optional[Path]
@@ -234,8 +695,50 @@ class Event:
     # The series this event belongs to
     series: "Series" = None
 
+    # Description, talks and links.
+    # If `_lazy_bodies` is set, this is loaded on first use, and may
+    # be unloaded again; use the properties below to access it.
+    _body: Optional[EventBody] = attr.ib(default=None, repr=False)
+    _lazy_bodies: Optional[Any] = attr.ib(default=None, repr=False)
+
+    # Size and modification time of the source file, as of when the data
+    # was loaded; set (with lazy bodies only) by Root.set_manifest
+    _stamp: Optional[tuple] = attr.ib(default=None, repr=False)
+
+    # Summaries of the talks, kept if the body is loaded lazily;
+    # use `talk_summaries` to access them
+    _talk_summaries: Optional[List[TalkSummary]] = attr.ib(
+        default=None, repr=False,
+    )
+
+    # Values derived from the above, computed when the event is created
+
+    # Full title, with the number or topic
+    title: str = attr.ib(init=False, repr=False)
+
+    # Identifier for use in URLs. Unique within the series
+    slug: str = attr.ib(init=False, repr=False)
+
+    date: datetime.date = attr.ib(init=False, repr=False)
+
+    # The body is part of the event, as far as users (and type-check
+    # errors) are concerned
+    _typecheck_inline = ('_body',)
+
+    def __attrs_post_init__(self):
+        parts = [self.name]
+        if self.number is not None:
+            parts.append('#{}'.format(self.number))
+        elif self.topic:
+            parts.append('–')
+        if self.topic:
+            parts.append(self.topic)
+        self.title = ' '.join(parts)
+        self.date = self.start.date()
+        self.slug = sys.intern(self.date.strftime('%Y-%m'))
+
     @classmethod
-    def load(cls, data, slug, *, cities, venues):
+    def load(cls, data, slug, *, cities, venues, lazy_bodies=None):
         venue_ident = data.get('venue')
         if venue_ident:
             venue = venues[data['venue']]
@@ -248,47 +751,137 @@ class Event:
         start = start.replace(tzinfo=CET)
 
         self = cls(
-            name=data['name'],
+            name=sys.intern(data['name']),
             venue=venue,
             number=data.get('number'),
             topic=data.get('topic'),
             city=cities[data['city']],
             start=start,
-            description=data.get('description'),
-            talks=[Talk.load(t) for t in data.get('talks', ())],
-            links=[EventLink(l) for l in data.get('urls', ())],
             source=data['_source'],
+            lazy_bodies=lazy_bodies,
         )
-        for talk in self.talks:
-            talk.event = self
+        # The body is kept even if it's loaded lazily, so that it can be
+        # type-checked with the rest of the data; it's unloaded after that
+        # (see _unload_bodies)
+        self._body = EventBody.load(data, self)
+        if lazy_bodies is not None:
+            self._talk_summaries = [
+                TalkSummary.from_talk(talk) for talk in self._body.talks
+            ]
         return self
 
+    def _get_body(self):
+        body = self._body
+        if self._lazy_bodies is not None:
+            body = self._lazy_bodies.get(self)
+        return body
+
     @property
-    def title(self):
-        parts = [self.name]
-        if self.number is not None:
-            parts.append('#{}'.format(self.number))
-        elif self.topic:
-            parts.append('–')
-        if self.topic:
-            parts.append(self.topic)
-        return ' '.join(parts)
+    def description(self):
+        return self._get_body().description
 
     @property
-    def slug(self):
-        """Identifier for use in URLs. Unique within the series"""
-        return self.date.strftime('%Y-%m')
+    def description_html(self):
+        return self._get_body().description_html
 
     @property
-    def date(self):
-        return self.start.date()
+    def talks(self):
+        return self._get_body().talks
+
+    @property
+    def links(self):
+        return self._get_body().links
+
+    @property
+    def talk_summaries(self):
+        """The talks, or their summaries if details are loaded lazily
+
+        Both have `title`, `speakers`, `is_lightning`, `videos` and `event`.
+        """
+        if self._lazy_bodies is None:
+            return self.talks
+        return self._talk_summaries
 
     @property
     def start_time(self):
         return self.start.time()
 
 
-@attrs(auto_attribs=True)
+class EventBodies:
+    """Loads bodies of events (see EventBody) from their files on demand
+
+    At most `max_bodies` bodies are kept loaded; the least recently used
+    ones are unloaded when more are needed.
+
+    Bodies are type-checked with the rest of the data, when it's loaded.
+    Later, a body is only loaded if its file did not change since then.
+    """
+
+    def __init__(self, datadir, max_bodies):
+        self.datadir = Path(datadir)
+        self.max_bodies = max_bodies
+        self._init_cache()
+
+    def _init_cache(self):
+        # Events with loaded bodies: id(event) -> event, least recent first
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {
+            'datadir': self.datadir,
+            'max_bodies': self.max_bodies,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    def get(self, event):
+        """Return the body of the given event, loading it if necessary"""
+        with self._lock:
+            body = event._body
+            if body is not None:
+                self._loaded[id(event)] = event
+                self._loaded.move_to_end(id(event))
+                return body
+        body = self._load(event)
+        with self._lock:
+            if event._body is None:
+                event._body = body
+            self._loaded[id(event)] = event
+            while len(self._loaded) > self.max_bodies:
+                key, old_event = self._loaded.popitem(last=False)
+                old_event._body = None
+            return event._body
+
+    def _load(self, event):
+        path = self.datadir / event._source
+        try:
+            with path.open('rb') as f:
+                stat = os.fstat(f.fileno())
+                if (
+                    event._stamp is not None
+                    and event._stamp != (stat.st_size, stat.st_mtime_ns)
+                ):
+                    # The file doesn't match the rest of the loaded data;
+                    # it'll be loaded again when the data is reloaded
+                    logger.warning(
+                        '%s changed since the data was loaded; '
+                        + 'not showing event details', path,
+                    )
+                    data = {}
+                else:
+                    data = yaml.load(f, Loader=_YAML_LOADER)
+        except FileNotFoundError:
+            logger.warning('%s is missing; not showing event details', path)
+            data = {}
+        body = EventBody.load(data, event)
+        _render_markdown(_body_markdown_fields(body))
+        return body
+
+
+@attrs(auto_attribs=True, slots=True)
 class Organizer:
     name: str
     phone: str = None
@@ -296,7 +889,7 @@ class Organizer:
     web: str = None
 
 
-@attrs(auto_attribs=True)
+@attrs(auto_attribs=True, slots=True)
 class Series:
     """A series of events"""
 
@@ -312,6 +905,13 @@ class Series:
     # Descriptions of the entire series
     description_cs: Optional[str]
     description_en: Optional[str]
+    # The descriptions converted to HTML, when the data is loaded
+    description_cs_html: Optional[Markup] = attr.ib(
+        default=None, init=False, repr=False,
+    )
+    description_en_html: Optional[Markup] = attr.ib(
+        default=None, init=False, repr=False,
+    )
 
     events: List[Event]
 
@@ -331,8 +931,73 @@ class Series:
     # Path where the data was loaded from (relative to data directory root)
     _source: Optional[Path]
 
+    # Indexes of `events`, built when the series is created:
+    # - by slug (YYYY-MM),
+    # - by number (numbers used by more than one event are left out),
+    # - by year (each list is sorted by date)
+    events_by_slug: Dict[str, Event] = attr.ib(init=False, repr=False)
+    events_by_number: Dict[int, Event] = attr.ib(init=False, repr=False)
+    events_by_year: Dict[int, List[Event]] = attr.ib(init=False, repr=False)
+
+    # Sorted list of years that have events
+    years: List[int] = attr.ib(init=False, repr=False)
+
+    # The recurrence rule, compiled when the series is created
+    # (a dateutil rruleset starting after the last planned event)
+    recurrence: Optional[Any] = attr.ib(init=False, repr=False)
+
+    # Planned occurrences in the RECURRENCE_WINDOW after the last planned
+    # event, as a sorted list
+    planned_occurrences: List[datetime.datetime] = attr.ib(
+        init=False, repr=False,
+    )
+
+    def __attrs_post_init__(self):
+        self.events_by_slug = {}
+        self.events_by_number = {}
+        self.events_by_year = {}
+        duplicate_numbers = set()
+        for event in self.events:
+            if event.slug in self.events_by_slug:
+                raise ValueError(
+                    f'{self.slug}: duplicate event slug {event.slug}: '
+                    + f'{self.events_by_slug[event.slug]._source} and '
+                    + f'{event._source}'
+                )
+            self.events_by_slug[event.slug] = event
+            if event.number is not None:
+                if event.number in self.events_by_number:
+                    duplicate_numbers.add(event.number)
+                self.events_by_number[event.number] = event
+            self.events_by_year.setdefault(event.date.year, []).append(event)
+        for number in duplicate_numbers:
+            del self.events_by_number[number]
+        self.years = sorted(self.events_by_year)
+
+        if self.recurrence_scheme is None or not self.events:
+            self.recurrence = None
+            self.planned_occurrences = []
+        else:
+            start = self._recurrence_start(self.events[-1].date)
+            self.recurrence = rrule.rrulestr(
+                self.recurrence_rule, dtstart=start, forceset=True,
+            )
+            self.planned_occurrences = self.recurrence.between(
+                start, start + RECURRENCE_WINDOW, inc=True,
+            )
+
     @classmethod
-    def load(cls, data, slug, *, cities, venues):
+    def load(cls, data, slug, *, cities, venues, extra_events=(),
+             event_bodies=None):
+        """Load a series
+
+        `extra_events` are already loaded events to include in the series
+        in addition to the ones in `data`. The caller is responsible for
+        setting their `series` attribute.
+
+        If `event_bodies` (an EventBodies) is given, bodies of the events
+        are loaded lazily.
+        """
         recurrence = data['series'].get('recurrence')
         if recurrence:
             rrule_str = recurrence['rrule']
@@ -351,12 +1016,16 @@ class Series:
                 'recurrence_description_en': None,
             }
 
+        new_events = [
+            Event.load(
+                e, slug, cities=cities, venues=venues,
+                lazy_bodies=event_bodies,
+            )
+            for slug, e in data.get('events', {}).items()
+        ]
         self = cls(
             events=sorted(
-                (
-                    Event.load(e, slug, cities=cities, venues=venues)
-                    for slug, e in data.get('events', {}).items()
-                ),
+                itertools.chain(extra_events, new_events),
                 key=lambda e: e.start
             ),
             slug=slug,
@@ -368,7 +1037,7 @@ class Series:
             source=data['series']['_source'],
             **recurrence_attrs,
         )
-        for event in self.events:
+        for event in new_events:
             event.series = self
         return self
 
@@ -383,8 +1052,7 @@ class Series:
         otherwise, infinite results may be generated.
         Note that less than `n` results may be yielded.
         """
-        scheme = self.recurrence_scheme
-        if scheme is None:
+        if self.recurrence is None:
             return ()
 
         last_planned_event = self.events[-1]
@@ -392,12 +1060,40 @@ class Series:
         if since is None or since < last_planned_event.date:
             since = last_planned_event.date
 
-        start = getattr(since, 'date', since)
+        start = self._recurrence_start(getattr(since, 'date', since))
+
+        planned = self.planned_occurrences
+        index = bisect.bisect_left(planned, start)
+        if n is not None and index + n <= len(planned):
+            return planned[index:index + n]
+        if planned and planned[-1] >= start:
+            # Continue after the precomputed window
+            rest = self.recurrence.xafter(planned[-1], inc=False)
+        else:
+            rest = self.recurrence.xafter(start, inc=True)
+        result = itertools.chain(planned[index:], rest)
+        if n is not None:
+            result = itertools.islice(result, n)
+        return result
 
-        start += relativedelta.relativedelta(days=+1)
+    def occurrences_between(self, after, before):
+        """Return planned occurrences between two datetimes, inclusive"""
+        if self.recurrence is None:
+            return []
+        planned = self.planned_occurrences
+        if planned and before <= planned[-1]:
+            return planned[
+                bisect.bisect_left(planned, after):
+                bisect.bisect_right(planned, before)
+            ]
+        return self.recurrence.between(after, before, inc=True)
+
+    def _recurrence_start(self, since):
+        """Return the datetime planned occurrences after `since` start at"""
+        start = since + relativedelta.relativedelta(days=+1)
 
-        if (scheme == 'monthly'
-                and last_planned_event
+        last_planned_event = self.events[-1]
+        if (self.recurrence_scheme == 'monthly'
                 and last_planned_event.date.year == start.year
                 and last_planned_event.date.month == start.month):
             # Monthly events try to have one event per month, so exclude
@@ -405,14 +1101,44 @@ class Series:
             start += relativedelta.relativedelta(months=+1)
             start = start.replace(day=1)
 
-        start = datetime.datetime.combine(start, datetime.time(tzinfo=CET))
-        result = rrule.rrulestr(self.recurrence_rule, dtstart=start)
-        if n is not None:
-            result = itertools.islice(result, n)
-        return result
+        return datetime.datetime.combine(start, datetime.time(tzinfo=CET))
+
+
+@attrs(auto_attribs=True, slots=True)
+class MediaIndex:
+    """Index of video recordings of talks"""
 
+    # Links to videos of all talks, newest first.
+    # (The links' `talk` is a TalkSummary if event details are loaded
+    # lazily.)
+    videos: List[TalkLink]
+
+    # Links to videos by slug of the series, newest first
+    videos_by_series: Dict[str, List[TalkLink]]
+
+    # Links to videos by speaker name, newest first
+    videos_by_speaker: Dict[str, List[TalkLink]]
+
+    @classmethod
+    def build(cls, events):
+        """Build the index for the given events, sorted by date"""
+        self = cls(videos=[], videos_by_series={}, videos_by_speaker={})
+        for event in reversed(events):
+            series_videos = self.videos_by_series.setdefault(
+                event.series.slug, [],
+            )
+            for talk in event.talk_summaries:
+                for link in talk.videos:
+                    self.videos.append(link)
+                    series_videos.append(link)
+                    for speaker in talk.speakers:
+                        self.videos_by_speaker.setdefault(
+                            speaker.name, [],
+                        ).append(link)
+        return self
 
-@attrs(auto_attribs=True)
+
+@attrs(auto_attribs=True, slots=True)
 class Root:
     cities: Dict[str, City]
     venues: Dict[str, Venue]
@@ -421,10 +1147,37 @@ class Root:
     # List of all events, sorted by date
     events: List[Event]
 
+    # Identifier of the loaded data: a digest of data file names, sizes
+    # and modification times
+    version: Optional[str] = None
+
+    # Time of the last modification of any data file
+    modified: Optional[datetime.datetime] = None
+
+    # Loader of event details, if they are loaded lazily
+    event_bodies: Optional[Any] = attr.ib(default=None, repr=False)
+
+    # True if the data was type-checked
+    validated: bool = attr.ib(default=False, repr=False)
+
+    # Index of `events` by date, built when the Root is created
+    events_by_date: Dict[datetime.date, List[Event]] = attr.ib(
+        init=False, repr=False,
+    )
+
+    # Index of videos, built when the Root is created
+    media: MediaIndex = attr.ib(init=False, repr=False)
+
     default_timezone = tz.gettz('Europe/Prague')
 
+    def __attrs_post_init__(self):
+        self.events_by_date = {}
+        for event in self.events:
+            self.events_by_date.setdefault(event.date, []).append(event)
+        self.media = MediaIndex.build(self.events)
+
     @classmethod
-    def load(cls, data):
+    def load(cls, data, *, validate=True, event_bodies=None):
         if data['meta']['version'] != 2:
             raise ValueError('Can only load version 2')
 
@@ -432,16 +1185,43 @@ class Root:
             slug: City.load(c, slug)
             for slug, c in data['cities'].items()
         }
-        venues = {}
-        for city in cities.values():
-            for slug, venue in city.venues.items():
-                if slug in venues:
-                    raise ValueError(f'duplicate venue slug: {slug}')
-                venues[slug] = venue
+        venues = _venues_by_slug(cities)
         series = {
-            slug: Series.load(s, slug, cities=cities, venues=venues)
+            slug: Series.load(
+                s, slug, cities=cities, venues=venues,
+                event_bodies=event_bodies,
+            )
             for slug, s in data['series'].items()
         }
+        self = cls.from_parts(
+            cities=cities, venues=venues, series=series,
+            event_bodies=event_bodies,
+        )
+        if validate:
+            typecheck(self)
+            self.validated = True
+        return self
+
+    def set_manifest(self, manifest):
+        """Set `version` and `modified` from a manifest of the data files
+
+        If event bodies are loaded lazily, events that don't have a stamp
+        of their source file yet get it from the manifest.
+        """
+        self.version = manifest_digest(manifest)
+        self.modified = datetime.datetime.fromtimestamp(
+            max(mtime for name, size, mtime in manifest) / 1e9,
+            tz=datetime.timezone.utc,
+        )
+        if self.event_bodies is not None:
+            stamps = {name: (size, mtime) for name, size, mtime in manifest}
+            for event in self.events:
+                if event._stamp is None:
+                    event._stamp = stamps.get(Path(event._source).as_posix())
+
+    @classmethod
+    def from_parts(cls, *, cities, venues, series, event_bodies=None):
+        """Create a Root from already loaded cities, venues and series"""
         events = sorted(
             (
                 event
@@ -450,11 +1230,70 @@ class Root:
             ),
             key=lambda e: e.start,
         )
-        self = cls(
+        return cls(
             cities=cities,
             venues=venues,
             series=series,
             events=events,
+            event_bodies=event_bodies,
         )
-        typecheck(self)
-        return self
+
+
+def render_markdown_fields(root, *, workers=None):
+    """Convert Markdown fields of all objects in `root` to HTML
+
+    Fields that were already converted are skipped, and so are bodies
+    of events that are not loaded (see EventBodies).
+    If `workers` is greater than 1, texts are converted in a pool
+    of that many processes.
+    """
+    _render_markdown(_markdown_fields(root), workers=workers)
+
+
+def _render_markdown(fields, *, workers=None):
+    pending = [
+        (obj, name, html_name)
+        for obj, name, html_name in fields
+        if getattr(obj, html_name) is None and getattr(obj, name) is not None
+    ]
+    rendered = render_texts(
+        [getattr(obj, name) for obj, name, html_name in pending],
+        workers=workers,
+    )
+    for obj, name, html_name in pending:
+        setattr(obj, html_name, rendered[getattr(obj, name)])
+
+
+def _markdown_fields(root):
+    """Yield (object, attribute, HTML attribute) for all Markdown fields"""
+    for venue in root.venues.values():
+        yield venue, 'notes', 'notes_html'
+    for series in root.series.values():
+        yield series, 'description_cs', 'description_cs_html'
+        yield series, 'description_en', 'description_en_html'
+    for event in root.events:
+        if event._body is not None:
+            yield from _body_markdown_fields(event._body)
+
+
+def _unload_bodies(events):
+    """Unload bodies of the given events, if they're loaded lazily"""
+    for event in events:
+        if event._lazy_bodies is not None:
+            event._body = None
+
+
+def _body_markdown_fields(body):
+    yield body, 'description', 'description_html'
+    for talk in body.talks:
+        yield talk, 'description', 'description_html'
+
+
+def _venues_by_slug(cities):
+    venues = {}
+    for city in cities.values():
+        for slug, venue in city.venues.items():
+            if slug in venues:
+                raise ValueError(f'duplicate venue slug: {slug}')
+            venues[slug] = venue
+    return venues
@@ -0,0 +1,420 @@
+"""Export the website as static files
+
+Every page of the site is determined by the data directory (and the current
+date), so the whole site can be rendered to files and served by a static
+web server like nginx. Next to each compressible file, precompressed
+`.gz` (and `.br`, if the `brotli` module is installed) versions are written
+for use with nginx's `gzip_static`/`brotli_static`.
+
+Redirects (like the old series aliases) are not exported, and neither
+are pages that need the running app, like search. Exported pages don't
+link to search.
+
+Pages at URLs that end with a slash are written to `index.html`, or to
+`index.json` for JSON pages. The static server needs to serve both as
+directory indexes, and serve files with the right MIME types. For nginx,
+the `.pyvocz-nginx.conf` file in the output directory does that; include
+it in the `server` (or `location`) block.
+
+The export is incremental: for each page, a key describing its inputs
+(the relevant data files, the pyvocz code and, for most pages, the date)
+is stored in the `.pyvocz-export.json` file in the output directory,
+along with the name and MIME type of the written file.
+Pages whose key did not change are not rendered again.
+"""
+
+from pathlib import Path
+from urllib.parse import urlparse
+import concurrent.futures
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+
+from flask import g, url_for
+
+from .app import create_app
+from .data import data_manifest, load_meta
+from .views import pregenerate_qrcodes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.pyvocz-export.json'
+NGINX_CONFIG_NAME = '.pyvocz-nginx.conf'
+
+# Extensions of index files, by MIME type (the default is `.html`)
+INDEX_EXTENSIONS = {
+    'application/json': '.json',
+}
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/atom+xml',
+    'application/javascript',
+    'application/json',
+    'application/rss+xml',
+    'image/svg+xml',
+    'image/x-icon',
+}
+
+FEED_TYPES = 'rss', 'atom', 'ics'
+
+# Endpoints of the app that site_pages exports
+EXPORTED_ENDPOINTS = {
+    'static', 'index', 'personal_info', 'calendar', 'series', 'event',
+    'event_qrcode', 'api_feed', 'api_series_feed', 'api_venue_geojson',
+    'google_verification',
+}
+
+# Endpoints of the app that site_pages does not export
+SKIPPED_ENDPOINTS = {
+    # Redirects
+    'subdomain_redirect', 'feedback_form_redirect', 'zaloz_redirect',
+    'nepyvo_redirect',
+    # Pages that need the running app
+    'search', 'api_search', 'reload_hook', 'reload_status', 'metrics',
+    # Not implemented yet (always 404)
+    'coc',
+}
+
+# The app used by export worker processes (inherited on fork)
+_app = None
+
+
+def export_site(out, *, datadir, snapshot=None, load_workers=None,
+                base_url='https://pyvo.cz', jobs=None, full=False):
+    """Export the site to the directory `out`
+
+    `base_url` is used for absolute URLs (e.g. in feeds and QR codes).
+    With `jobs` greater than 1, pages are rendered in that many processes.
+    If `full` is true, all pages are rendered, even if their inputs
+    did not change since the last export.
+
+    Returns the number of rendered pages.
+    """
+    global _app
+
+    out = Path(out)
+    parsed_url = urlparse(base_url)
+    app = create_app(
+        datadir=datadir, snapshot=snapshot, load_workers=load_workers,
+        host=parsed_url.hostname, port=parsed_url.port or 80,
+        config={
+            'PREFERRED_URL_SCHEME': parsed_url.scheme,
+            # Each page is only rendered once
+            'PYVO_PAGE_CACHE': False,
+            # QR codes are generated only for the exported QR code pages
+            # (see below)
+            'PYVO_PREGENERATE_QRCODES': False,
+            'PYVO_QRCODES': True,
+            'PYVO_BASE_URL': base_url,
+            # Search is not exported; don't link to it
+            'PYVO_SEARCH': False,
+        },
+    )
+
+    pages = dict(site_pages(app, base_url))
+
+    manifest_path = out / MANIFEST_NAME
+    try:
+        with manifest_path.open() as f:
+            old_files = json.load(f)
+    except FileNotFoundError:
+        old_files = {}
+    # Manifests of older versions map URLs to keys only; their files
+    # are all rendered again
+    old_files = {
+        url: entry for url, entry in old_files.items()
+        if isinstance(entry, dict)
+    }
+
+    to_render = [
+        url for url, key in pages.items()
+        if full
+        or url not in old_files
+        or old_files[url]['key'] != key
+        or not (out / old_files[url]['file']).exists()
+    ]
+    logger.info('Rendering %s of %s pages', len(to_render), len(pages))
+    pregenerate_qrcodes(app, _qrcode_events(app, base_url, to_render))
+
+    _app = app
+    try:
+        if jobs is not None and jobs > 1:
+            context = multiprocessing.get_context('fork')
+            with concurrent.futures.ProcessPoolExecutor(
+                jobs, mp_context=context,
+            ) as executor:
+                results = list(executor.map(
+                    _export_page, [out] * len(to_render), to_render,
+                    [base_url] * len(to_render),
+                    chunksize=max(1, len(to_render) // (jobs * 4)),
+                ))
+        else:
+            results = [_export_page(out, url, base_url) for url in to_render]
+    finally:
+        _app = None
+
+    rendered = set(to_render)
+    new_files = {
+        url: old_files[url] for url in pages if url not in rendered
+    }
+    for url, written in zip(to_render, results):
+        if written is not None:
+            file, mimetype = written
+            new_files[url] = {
+                'key': pages[url], 'file': file, 'mimetype': mimetype,
+            }
+
+    # Remove files that are no longer on the site
+    old_paths = {entry['file'] for entry in old_files.values()}
+    new_paths = {entry['file'] for entry in new_files.values()}
+    for file in old_paths - new_paths:
+        for suffix in '', '.gz', '.br':
+            try:
+                os.unlink(out / f'{file}{suffix}')
+            except FileNotFoundError:
+                pass
+
+    out.mkdir(parents=True, exist_ok=True)
+    with manifest_path.open('w') as f:
+        json.dump(new_files, f, indent=0, sort_keys=True)
+    _write(out / NGINX_CONFIG_NAME, _nginx_config(new_files).encode('utf-8'))
+
+    return len(to_render)
+
+
+def site_pages(app, base_url):
+    """Yield (url, key) for all pages of the site
+
+    The key is a digest of everything the page depends on.
+
+    Raises ValueError if the app has an endpoint that is neither exported
+    nor listed in SKIPPED_ENDPOINTS.
+    """
+    unknown = {
+        rule.endpoint for rule in app.url_map.iter_rules()
+    } - EXPORTED_ENDPOINTS - SKIPPED_ENDPOINTS
+    if unknown:
+        raise ValueError(
+            'endpoints neither exported nor skipped: '
+            + ', '.join(sorted(unknown))
+        )
+
+    db = app.db
+    today = datetime.date.today()
+    datadir = Path(app.config['PYVO_DATADIR'])
+    files = {
+        name: f'{size}:{mtime}'
+        for name, size, mtime in data_manifest(
+            datadir, exclude=load_meta(datadir).ignored_files,
+        )
+    }
+    code = _code_digest()
+
+    def data_key(*prefixes):
+        if not prefixes:
+            # All the data
+            return db.version
+        return _digest(
+            f'{name}={stat}' for name, stat in files.items()
+            if name.startswith(prefixes)
+        )
+
+    def key(*parts):
+        return _digest([code, *parts])
+
+    everything = key(data_key(), today.isoformat())
+    years = [e.date.year for e in db.events[:1] + db.events[-1:]]
+    years.append(today.year)
+
+    with app.test_request_context(base_url=base_url):
+        g.lang_code = None
+
+        def url(endpoint, **kwargs):
+            assert endpoint in EXPORTED_ENDPOINTS
+            return url_for(endpoint, **kwargs)
+
+        static_dir = Path(app.static_folder)
+        for path in sorted(static_dir.glob('**/*')):
+            if path.is_file():
+                stat = path.stat()
+                filename = path.relative_to(static_dir).as_posix()
+                yield (
+                    url('static', filename=filename),
+                    key(f'{stat.st_size}:{stat.st_mtime_ns}'),
+                )
+
+        for slug in db.venues:
+            yield url('api_venue_geojson', venueslug=slug), key(data_key())
+
+        for lang_code in 'cs', 'en':
+            def page(endpoint, **kwargs):
+                return url(endpoint, lang_code=lang_code, **kwargs)
+
+            yield page('index'), everything
+            yield page('personal_info'), key()
+            yield page('calendar', year=None), everything
+            for year in range(min(years), max(years) + 1):
+                yield page('calendar', year=year), everything
+            for feed_type in FEED_TYPES:
+                yield page('api_feed', feed_type=feed_type), everything
+
+            for series in db.series.values():
+                series_key = key(
+                    data_key(f'series/{series.slug}/', 'cities/'),
+                    today.isoformat(),
+                )
+                yield page('series', series_slug=series.slug), series_key
+                yield page('series', series_slug=series.slug, all='all'), \
+                    series_key
+                for year in series.years:
+                    yield page('series', series_slug=series.slug, year=year), \
+                        series_key
+                for feed_type in FEED_TYPES:
+                    yield page('api_series_feed', series_slug=series.slug,
+                               feed_type=feed_type), series_key
+
+                for event in series.events:
+                    event_key = key(
+                        data_key(
+                            str(event._source), str(series._source),
+                            f'cities/{event.city.slug}/',
+                        ),
+                        today.isoformat(),
+                    )
+                    yield page('event', series_slug=series.slug,
+                               date_slug=event.slug), event_key
+                    # QR codes only depend on the URL
+                    yield page('event_qrcode', series_slug=series.slug,
+                               date_slug=event.slug), key()
+
+        yield url('google_verification', lang_code='cs'), key()
+
+
+def _qrcode_events(app, base_url, urls):
+    """Return events whose QR code pages are among `urls`"""
+    urls = set(urls)
+    events = []
+    with app.test_request_context(base_url=base_url):
+        g.lang_code = None
+        for event in app.db.events:
+            if any(
+                url_for('event_qrcode', lang_code=lang_code,
+                        series_slug=event.series.slug, date_slug=event.slug)
+                in urls
+                for lang_code in ('cs', 'en')
+            ):
+                events.append(event)
+    return events
+
+
+def _export_page(out, url, base_url):
+    """Render the page at `url` into `out`
+
+    Return the name of the written file (relative to `out`) and its
+    MIME type, or None if the page was not written.
+    """
+    with _app.test_client() as client:
+        response = client.get(url, base_url=base_url)
+    if response.status_code != 200:
+        logger.info('Not exporting %s: status %s', url, response.status)
+        return None
+    body = response.get_data()
+    mimetype = response.mimetype
+    file = _url_to_file(url, mimetype)
+    path = out / file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write(path, body)
+
+    if mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES:
+        _write(f'{path}.gz', gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(f'{path}.br', brotli.compress(body))
+    return file, mimetype
+
+
+def _write(path, content):
+    """Atomically write `content` to the file at `path`"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _url_to_file(url, mimetype):
+    """Return the name of the file for a page, relative to the output dir"""
+    path = urlparse(url).path.lstrip('/')
+    if not path or path.endswith('/'):
+        path += 'index' + INDEX_EXTENSIONS.get(mimetype, '.html')
+    return path
+
+
+def _nginx_config(files):
+    """Return nginx configuration for serving the given exported files
+
+    `files` is the content of the export manifest.
+    """
+    types = {}
+    for url, entry in sorted(files.items()):
+        name = entry['file'].rpartition('/')[-1]
+        stem, dot, extension = name.rpartition('.')
+        if not dot:
+            logger.warning(
+                '%s has no file extension; it will be served as the '
+                'default type', entry['file'],
+            )
+            continue
+        if not stem:
+            # Hidden file (like `.gitignore`)
+            continue
+        mimetype = types.setdefault(extension, entry['mimetype'])
+        if mimetype != entry['mimetype']:
+            logger.warning(
+                '%s will be served as %s, not %s',
+                entry['file'], mimetype, entry['mimetype'],
+            )
+    indexes = ['index.html']
+    indexes.extend(f'index{ext}' for ext in INDEX_EXTENSIONS.values())
+    lines = [
+        '# Generated by pyvocz export; include in the `server` block',
+        'index ' + ' '.join(indexes) + ';',
+        'types {',
+        *(
+            f'    {mimetype} {extension};'
+            for extension, mimetype in sorted(types.items())
+        ),
+        '}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _digest(parts):
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def _code_digest():
+    """Digest of the pyvocz code and templates"""
+    package_dir = Path(__file__).parent
+    paths = [
+        *package_dir.glob('*.py'),
+        *package_dir.glob('templates/**/*.html'),
+    ]
+    parts = []
+    for path in sorted(paths):
+        stat = path.stat()
+        name = path.relative_to(package_dir).as_posix()
+        parts.append(f'{name}:{stat.st_size}:{stat.st_mtime_ns}')
+    return _digest(parts)
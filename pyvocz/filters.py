@@ -2,9 +2,9 @@ import re
 
 from flask import g, url_for
 from markupsafe import Markup, escape
-from markdown import markdown as convert_markdown
 from urllib.parse import urlparse
-import textwrap
+
+from .markup import render_markdown_cached
 
 __all__ = ('mail_link', 'nl2br', 'monthname', 'shortdayname', 'shortmonth',
            'shortday', 'longdate', 'dayname', 'th', 'event_url',
@@ -132,9 +132,7 @@ def event_link(event, *, text=None):
 
 
 def markdown(text):
-    text = textwrap.dedent(text)
-    result = Markup(convert_markdown(text))
-    return result
+    return render_markdown_cached(text)
 
 
 def get_site_name(link):
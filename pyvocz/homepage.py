@@ -0,0 +1,101 @@
+"""Contents of the homepage
+
+The homepage shows featured and past events, the latest videos and
+a calendar. These only change when the date or the data changes, so they
+are computed once per day and data version (see get_homepage).
+"""
+
+from bisect import bisect
+from typing import Any, List
+import datetime
+import threading
+
+from attr import attrs
+
+from .calendar import get_calendar
+from .data import Event, TalkLink
+
+
+# Number of videos to show
+NUM_VIDEOS = 12
+
+# Events that took place this long ago are not featured any more
+FEATURED_PERIOD = datetime.timedelta(days=31 * 6)
+
+
+@attrs(auto_attribs=True, slots=True)
+class Homepage:
+    """Everything the homepage shows, for one day and data version"""
+
+    # The data and the date the homepage was computed for
+    db: Any
+    today: datetime.date
+
+    # Upcoming or recent event of each active series; upcoming first,
+    # then by distance from today
+    featured_events: List[Event]
+
+    # Last events of series that are not active any more, newest first
+    past_events: List[Event]
+
+    # Latest videos
+    videos: List[TalkLink]
+
+    # Calendar of the previous, current and next month
+    calendar: Any
+
+    @classmethod
+    def build(cls, db, today):
+        # Split series into "featured" (recent) and "past" which last took
+        # place 6+ months ago.
+        featured_events = []
+        past_events = []
+        for series in db.series.values():
+            keys = [event.date for event in series.events]
+            best_event_index = bisect(keys, today)
+            if best_event_index >= len(keys):
+                last_event = series.events[-1]
+                if today - last_event.date > FEATURED_PERIOD:
+                    past_events.append(last_event)
+                else:
+                    featured_events.append(last_event)
+            else:
+                featured_events.append(series.events[best_event_index])
+
+        featured_events.sort(key=lambda e: (e.date < today, today - e.date))
+        past_events.sort(key=lambda e: e.date, reverse=True)
+
+        return cls(
+            db=db,
+            today=today,
+            featured_events=featured_events,
+            past_events=past_events,
+            videos=db.media.videos[:NUM_VIDEOS],
+            calendar=get_calendar(
+                db, first_year=today.year, first_month=today.month - 1,
+                num_months=3,
+            ),
+        )
+
+
+_homepage = None
+_homepage_lock = threading.Lock()
+
+
+def get_homepage(db, today=None):
+    """Return the Homepage for the given data and date, building it if needed
+
+    `today` defaults to the current date in the data's time zone.
+    Only the most recently used Homepage is kept.
+    """
+    global _homepage
+    if today is None:
+        today = datetime.datetime.now(tz=db.default_timezone).date()
+    with _homepage_lock:
+        if (
+            _homepage is None
+            or _homepage.db is not db
+            or _homepage.today != today
+        ):
+            _homepage = Homepage.build(db, today)
+        return _homepage
@@ -0,0 +1,161 @@
+"""Streaming iCalendar (RFC 5545) output
+
+The calendar is generated as a sequence of strings, one per component,
+so it can be streamed without building the whole calendar in memory.
+"""
+
+import datetime
+
+
+PRODID = '-//Pyvec//pyvo.cz//CS'
+
+# Definition of the timezone used for recurring events
+VTIMEZONE = """\
+BEGIN:VTIMEZONE
+TZID:Europe/Prague
+BEGIN:DAYLIGHT
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+TZNAME:CEST
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+TZNAME:CET
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+END:STANDARD
+END:VTIMEZONE"""
+
+
+def generate_ics(events, *, event_url, dtstamp, recurrence_series=(),
+                 tentative_name='({} – tentative date)', today=None,
+                 descriptions=True):
+    """Generate an iCalendar file with the given events
+
+    Yields strings; joined together they form the whole file.
+
+    `event_url` is a function that returns the URL of an event.
+    `dtstamp` is the datetime the information was last changed.
+
+    For each series in `recurrence_series` that has a recurrence rule,
+    a recurring event named using `tentative_name` is added. It starts
+    at the series' next planned occurrence after `today`.
+
+    If `descriptions` is false, descriptions of events are left out.
+    """
+    if today is None:
+        today = datetime.date.today()
+
+    yield _component([
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+    ])
+    if any(series.recurrence_rule for series in recurrence_series):
+        yield VTIMEZONE.replace('\n', '\r\n') + '\r\n'
+
+    stamp = _format_utc(dtstamp)
+
+    for event in events:
+        if event.venue:
+            location = '{}, {}, {}'.format(
+                event.venue.name,
+                event.venue.short_address,
+                event.city.name,
+            )
+            geo_obj = event.venue
+        else:
+            location = event.city.name
+            geo_obj = event.city.location
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{event.series.slug}-{event.date}@pyvo.cz',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{_format_utc(event.start)}',
+            f'SUMMARY:{_escape(event.title)}',
+            f'LOCATION:{_escape(location)}',
+            'GEO:{:f};{:f}'.format(
+                float(geo_obj.latitude), float(geo_obj.longitude),
+            ),
+            f'URL:{event_url(event)}',
+        ]
+        if descriptions and event.description:
+            lines.append(f'DESCRIPTION:{_escape(event.description)}')
+        lines.append('END:VEVENT')
+        yield _component(lines)
+
+    for series in recurrence_series:
+        if not series.recurrence_rule:
+            continue
+        first = next(iter(series.next_occurrences(1, since=today)), None)
+        if first is None:
+            continue
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{series.slug}-recurrence@pyvo.cz',
+            f'DTSTAMP:{stamp}',
+            'DTSTART;TZID=Europe/Prague:' + first.strftime('%Y%m%dT%H%M%S'),
+            *_recurrence_lines(series.recurrence_rule),
+            f'SUMMARY:{_escape(tentative_name.format(series.name))}',
+            'CATEGORIES:tentative-date',
+            'END:VEVENT',
+        ]
+        yield _component(lines)
+
+    yield 'END:VCALENDAR\r\n'
+
+
+def _recurrence_lines(rule):
+    """Convert a dateutil recurrence rule string to iCalendar lines"""
+    for line in rule.splitlines():
+        line = line.strip()
+        if not line or line.startswith('DTSTART'):
+            continue
+        if ':' not in line:
+            line = 'RRULE:' + line
+        yield line
+
+
+def _component(lines):
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def _format_utc(dt):
+    dt = dt.astimezone(datetime.timezone.utc)
+    return dt.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\r\n', '\\n')
+            .replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Fold a content line to at most 75 octets per line"""
+    if len(line.encode('utf-8')) <= 75:
+        return line
+    parts = []
+    current = ''
+    current_length = 0
+    # Continuation lines start with a space, which counts into the limit
+    limit = 75
+    for char in line:
+        char_length = len(char.encode('utf-8'))
+        if current_length + char_length > limit:
+            parts.append(current)
+            current = ''
+            current_length = 0
+            limit = 74
+        current += char
+        current_length += char_length
+    parts.append(current)
+    return '\r\n '.join(parts)
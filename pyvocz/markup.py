@@ -0,0 +1,44 @@
+"""Conversion of Markdown texts to HTML
+
+Markdown fields of the data model are converted once, when data is
+loaded (see `render_texts`); templates use the converted HTML directly.
+The `markdown` template filter, used for other texts, keeps recent
+results in an LRU cache.
+"""
+
+import concurrent.futures
+import functools
+import textwrap
+
+from markupsafe import Markup
+
+
+def render_markdown(text):
+    """Convert a Markdown text to HTML"""
+    # The markdown library is slow to import, and isn't needed when data
+    # is loaded from a snapshot
+    from markdown import markdown as convert_markdown
+
+    text = textwrap.dedent(text)
+    return Markup(convert_markdown(text))
+
+
+@functools.lru_cache(maxsize=1024)
+def render_markdown_cached(text):
+    """Convert a Markdown text to HTML, caching recent results"""
+    return render_markdown(text)
+
+
+def render_texts(texts, *, workers=None):
+    """Convert the given Markdown texts; return a dict of the results
+
+    If `workers` is greater than 1, texts are converted in a pool
+    of that many processes.
+    """
+    texts = list(set(texts))
+    if workers is not None and workers > 1 and len(texts) > 1:
+        chunksize = max(1, len(texts) // (workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = executor.map(render_markdown, texts, chunksize=chunksize)
+            return dict(zip(texts, results))
+    return {text: render_markdown(text) for text in texts}
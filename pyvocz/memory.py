@@ -0,0 +1,70 @@
+"""Measuring memory used by the data model
+
+`memory_report` walks all objects reachable from a Root, and attributes
+each to a model class (one of the attrs classes in pyvocz.data):
+a model object's own size is counted for its class, and so are the
+sizes of other objects (strings, lists, dicts, datetimes...) that are
+first reached through it. Each object is counted once, however many
+times it is shared.
+"""
+
+import gc
+import sys
+import types
+
+import attr
+
+from . import data
+
+
+# Objects of these types are not counted, and not walked into
+_SKIPPED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+_MODEL_CLASSES = frozenset(
+    cls for cls in vars(data).values()
+    if isinstance(cls, type) and attr.has(cls) and cls.__module__ == data.__name__
+)
+
+
+def memory_report(root):
+    """Return memory usage of the given Root, by model class
+
+    The result is a dict mapping class names to dicts with 'count'
+    (number of model objects) and 'bytes' (memory attributed to the class).
+    """
+    report = {}
+    seen = {id(root)}
+    # Stack of (object, name of the model class it's attributed to)
+    stack = [(root, type(root).__name__)]
+    while stack:
+        obj, owner = stack.pop()
+        if type(obj) in _MODEL_CLASSES:
+            owner = type(obj).__name__
+            entry = report.setdefault(owner, {'count': 0, 'bytes': 0})
+            entry['count'] += 1
+        else:
+            entry = report[owner]
+        entry['bytes'] += sys.getsizeof(obj)
+        for referent in gc.get_referents(obj):
+            if id(referent) in seen or isinstance(referent, _SKIPPED_TYPES):
+                continue
+            seen.add(id(referent))
+            stack.append((referent, owner))
+    return report
+
+
+def format_memory_report(report):
+    """Format the result of memory_report as a table"""
+    lines = [f'{"Class":<12} {"Objects":>9} {"Bytes":>12} {"Per object":>11}']
+    rows = sorted(report.items(), key=lambda item: -item[1]['bytes'])
+    for name, entry in rows:
+        lines.append(
+            f'{name:<12} {entry["count"]:>9} {entry["bytes"]:>12}'
+            f' {entry["bytes"] // entry["count"]:>11}'
+        )
+    total = sum(entry['bytes'] for entry in report.values())
+    lines.append(f'{"Total":<12} {"":>9} {total:>12}')
+    return '\n'.join(lines)
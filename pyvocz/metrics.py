@@ -0,0 +1,203 @@
+"""Timing of requests, for finding out where the time goes
+
+This is opt-in: it's only active if the PYVO_METRICS config option is set
+(see init_metrics). Then:
+
+- Time spent in each *stage* of a request is measured. The stages are:
+  - `total`: the whole request, from the first to the last request hook
+  - `view`: `total` minus `render`
+  - `render`: rendering Jinja templates
+  - `calendar`: computing calendars (get_calendar)
+  - `feed`: generating feeds (RSS, Atom, iCalendar)
+  The `calendar` and `feed` stages are parts of `view`.
+- Each response has a `Server-Timing` header with the times.
+  Streamed responses (like iCalendar feeds) are generated after the header
+  is sent, so for them the header only covers the time until streaming
+  starts. The histograms cover the whole response.
+- Histograms of the times, by endpoint and stage, are available at
+  `/_metrics?password=<pull password>` in the Prometheus text format.
+  Each worker process keeps its own histograms.
+- Adding `?_profile=1&password=<pull password>` to a URL returns
+  a cProfile report of the request instead of the response.
+
+Code marks the stages with the `timed` decorator or context manager,
+which does nothing unless the current request is being timed.
+"""
+
+import contextlib
+import io
+import threading
+import time
+
+from flask import g, has_request_context, request, Response
+from flask import before_render_template, template_rendered
+
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+)
+
+# Number of functions to show in profile reports
+PROFILE_LIMIT = 60
+
+
+class timed(contextlib.ContextDecorator):
+    """Add the time spent in a block or function to a stage of the request"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        timings = _get_timings()
+        if timings is not None:
+            g._pyvo_starts.setdefault(self.stage, []).append(
+                time.perf_counter(),
+            )
+
+    def __exit__(self, *exc_info):
+        timings = _get_timings()
+        if timings is not None:
+            starts = g._pyvo_starts.get(self.stage)
+            if starts:
+                elapsed = time.perf_counter() - starts.pop()
+                timings[self.stage] = timings.get(self.stage, 0) + elapsed
+
+
+def _get_timings():
+    """Return the dict of stage timings of the current request, or None"""
+    if has_request_context():
+        return g.get('_pyvo_timings')
+    return None
+
+
+class Metrics:
+    """Histograms of request stage timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (endpoint, stage) -> [bucket counts..., count, sum]
+        self._histograms = {}
+
+    def observe(self, endpoint, timings):
+        """Record the stage timings of a request"""
+        with self._lock:
+            for stage, seconds in timings.items():
+                histogram = self._histograms.get((endpoint, stage))
+                if histogram is None:
+                    histogram = [0] * (len(BUCKETS) + 1) + [0.0]
+                    self._histograms[endpoint, stage] = histogram
+                for i, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                        histogram[i] += 1
+                        break
+                histogram[-2] += 1
+                histogram[-1] += seconds
+
+    def to_prometheus(self):
+        """Return the histograms in the Prometheus text format"""
+        name = 'pyvocz_request_stage_seconds'
+        lines = [
+            f'# HELP {name} Time spent in stages of handling requests',
+            f'# TYPE {name} histogram',
+        ]
+        with self._lock:
+            histograms = sorted(
+                (key, list(value)) for key, value in self._histograms.items()
+            )
+        for (endpoint, stage), histogram in histograms:
+            labels = f'endpoint="{endpoint}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            count, total = histogram[-2:]
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {total}')
+            lines.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """Set up timing of requests for the app, if enabled in its config"""
+    if not app.config['PYVO_METRICS']:
+        return
+    app.metrics = Metrics()
+
+    @app.before_request
+    def start_timing():
+        g._pyvo_timings = {}
+        # Start times of stages that are being timed: stage -> [time]
+        g._pyvo_starts = {}
+        g._pyvo_request_start = time.perf_counter()
+        if request.args.get('_profile'):
+            from .views import check_pull_password
+
+            check_pull_password()
+            import cProfile
+
+            g._pyvo_profile = cProfile.Profile()
+            g._pyvo_profile.enable()
+
+    @app.after_request
+    def finish_timing(response):
+        timings = g.get('_pyvo_timings')
+        if timings is None:
+            return response
+        profile = g.pop('_pyvo_profile', None)
+        if profile is not None:
+            profile.disable()
+        endpoint = str(request.endpoint)
+        request_start = g._pyvo_request_start
+
+        def finish():
+            timings['total'] = time.perf_counter() - request_start
+            timings['view'] = timings['total'] - timings.get('render', 0)
+            return dict(timings)
+
+        current = finish()
+        if response.is_streamed and profile is None:
+            # The body is generated (and timed) after this; the histograms
+            # get the timings when the response is closed
+            response.call_on_close(
+                lambda: app.metrics.observe(endpoint, finish()),
+            )
+        else:
+            app.metrics.observe(endpoint, current)
+        if profile is not None:
+            return profile_response(profile)
+        response.headers['Server-Timing'] = ', '.join(
+            f'{stage};dur={seconds * 1000:.2f}'
+            for stage, seconds in sorted(current.items())
+        )
+        return response
+
+    render_timer = timed('render')
+    before_render_template.connect(
+        lambda sender, **extra: render_timer.__enter__(), app, weak=False,
+    )
+    template_rendered.connect(
+        lambda sender, **extra: render_timer.__exit__(), app, weak=False,
+    )
+
+    @app.route('/_metrics')
+    def metrics():
+        from .views import check_pull_password
+
+        check_pull_password()
+        return Response(
+            app.metrics.to_prometheus(),
+            mimetype='text/plain; version=0.0.4',
+        )
+
+
+def profile_response(profile):
+    """Return a response with a report of the given cProfile.Profile"""
+    import pstats
+
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats('cumulative').print_stats(PROFILE_LIMIT)
+    return Response(out.getvalue(), mimetype='text/plain')
@@ -0,0 +1,65 @@
+"""Sharing the loaded data between pre-forked worker processes
+
+Normally each worker process calls create_app, so it parses (or unpickles)
+all the data and holds its own copy. In pre-fork mode, the app is created
+once in the master process, and workers are forked from it. They share
+the memory pages holding the data, copy-on-write.
+
+For the pages to stay shared, the data must not be written to, and
+that includes the garbage collector's bookkeeping in each object's
+header. So, before forking, all objects are moved to the permanent
+generation with `gc.freeze()`, and the garbage collector in workers
+does not touch them. (Reference counts are still written to, so pages
+with frequently used objects do get copied.)
+
+Data is never reloaded in workers; instead, new workers are forked:
+
+- The worker that runs a reload job writes the new snapshot, then asks
+  the master to reload (with SIGHUP).
+- The master loads the new data (`reload_data`), and forks new workers.
+  Old workers finish their requests and exit.
+- Other workers ignore the new generation (see Reloader.check_generation).
+
+See `gunicorn.conf.py` for running pyvo.cz this way with Gunicorn.
+Other servers need to call `enable` in the master process after creating
+the app, `freeze` before forking, and `reload_data` on SIGHUP.
+
+Memory saved per worker, as measured by `benchmarks/prefork.py`,
+is in the README.
+"""
+
+import gc
+import logging
+import os
+import signal
+
+
+logger = logging.getLogger(__name__)
+
+
+def enable(app):
+    """Enable pre-fork mode; call in the master process"""
+    app.reloader.master_pid = os.getpid()
+    gc.collect()
+
+
+def freeze():
+    """Move all objects to the permanent generation; call before forking"""
+    gc.freeze()
+
+
+def reload_data(app):
+    """Load the latest data in the master process
+
+    Forking new workers is left to the server.
+    """
+    # Let the old data be collected
+    gc.unfreeze()
+    app.reloader.sync()
+    gc.collect()
+    logger.info('Data version %s loaded for new workers', app.db.version)
+
+
+def request_reload(master_pid):
+    """Ask the master process to load new data and fork new workers"""
+    os.kill(master_pid, signal.SIGHUP)
@@ -0,0 +1,371 @@
+"""Reloading data in the background
+
+The reload hook only queues a *job*; a background thread in the worker
+process runs it. When a job produces new data, the data is swapped in
+as `app.db` in a single assignment, so each request sees either the old
+or the new data.
+
+Worker processes share a state directory: `<snapshot>.reload` next to
+the snapshot file if the app uses one, otherwise `reload` in the cache
+directory (PYVO_CACHE_DIR), or a directory named after the data directory
+in the system's temporary directory. It contains:
+
+- `generation`: the version of the latest data. After a reload, the worker
+  that did it writes the new version here. Other workers check the file
+  (at most once per GENERATION_CHECK_INTERVAL, before handling a request)
+  and load the new data when it changes (from the snapshot, if used;
+  otherwise they parse the data files).
+- `workers/<pid>.json`: the data version each worker is serving
+  (removed when the worker exits),
+- `jobs/<id>.json`: the status of recent jobs,
+
+so the status endpoint can report on all workers, whichever worker
+handles the request. If the state directory can't be written to,
+workers only know about themselves.
+
+In pre-fork mode (see pyvocz.prefork), workers don't load new data;
+the master process does, and forks new workers.
+"""
+
+from pathlib import Path
+import atexit
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from . import prefork
+from .data import load_data, update_data
+from .search import get_search_index
+from .warmup import warm_up
+
+
+logger = logging.getLogger(__name__)
+
+# Number of finished jobs to remember
+MAX_JOBS = 20
+
+# Minimum time between checks of the generation file, in seconds
+GENERATION_CHECK_INTERVAL = 1
+
+
+class Reloader:
+    """Runs data reloading jobs for a Flask app in a background thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._jobs = collections.OrderedDict()
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._thread_pid = None
+        self._generation_checked = 0
+        self._requested_version = None
+        # PID of the master process, in pre-fork mode; see pyvocz.prefork
+        self.master_pid = None
+        # PID of the process that registered removal of its worker file
+        self._worker_pid = None
+
+        snapshot = app.config['PYVO_SNAPSHOT']
+        cache_dir = app.config['PYVO_CACHE_DIR']
+        if snapshot is not None:
+            self.state_dir = Path(f'{snapshot}.reload')
+        elif cache_dir is not None:
+            self.state_dir = Path(cache_dir) / 'reload'
+        else:
+            datadir = str(app.config['PYVO_DATADIR'])
+            digest = hashlib.sha256(datadir.encode('utf-8')).hexdigest()
+            self.state_dir = (
+                Path(tempfile.gettempdir()) / f'pyvocz-reload-{digest[:16]}'
+            )
+
+    def enqueue(self, kind, **params):
+        """Queue a job; return its status (a dict with an 'id')
+
+        Kinds of jobs are:
+        - 'pull': `git pull` the data directory and apply the changes
+        - 'update': apply changes to files given as `changed_paths`
+        - 'sync': load the latest data (from the shared snapshot, if used)
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'pid': os.getpid(),
+            'queued': _now(),
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            self._queue.append((job, params))
+            self._start_thread()
+            self._changed.notify_all()
+        self._save_job(job)
+        return dict(job)
+
+    def wait(self, timeout=None):
+        """Wait until all queued jobs finish; return true if they did"""
+        with self._lock:
+            return self._changed.wait_for(
+                lambda: not self._queue and not any(
+                    job['status'] in ('queued', 'running')
+                    for job in self._jobs.values()
+                ),
+                timeout,
+            )
+
+    def get_job(self, job_id):
+        """Return the status of a job (possibly run by another worker)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if job_id.isalnum():
+            try:
+                with open(self.state_dir / 'jobs' / f'{job_id}.json') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def status(self):
+        """Return the status of this worker and all known workers"""
+        db = self.app.db
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return {
+            'pid': os.getpid(),
+            'version': db.version,
+            'jobs': jobs,
+            'generation': self._read_generation(),
+            'workers': list(self._read_workers()),
+        }
+
+    def check_generation(self):
+        """Queue a 'sync' job if another worker published new data
+
+        Called before each request; the generation file is only read
+        once per GENERATION_CHECK_INTERVAL.
+        """
+        now = time.monotonic()
+        if now - self._generation_checked < GENERATION_CHECK_INTERVAL:
+            return
+        if self._generation_checked == 0:
+            self._save_worker()
+        self._generation_checked = now
+        if self.master_pid is not None:
+            # The master forks workers with the new data
+            return
+        version = self._read_generation()
+        if (
+            version is not None
+            and version != self.app.db.version
+            and version != self._requested_version
+        ):
+            self._requested_version = version
+            logger.info('Data version %s published; syncing', version)
+            self.enqueue('sync')
+
+    def _start_thread(self):
+        # Called with the lock held.
+        # (After a fork, the thread doesn't exist in the child process.)
+        if self._thread_pid != os.getpid() or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='pyvocz-reloader', daemon=True,
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: self._queue)
+                job, params = self._queue.popleft()
+                job['status'] = 'running'
+                job['started'] = _now()
+            self._save_job(job)
+            try:
+                getattr(self, f'_run_{job["kind"]}')(job, **params)
+            except Exception as e:
+                logger.exception('Reload job %s failed', job['id'])
+                result = {
+                    'status': 'failed',
+                    'error': f'{type(e).__name__}: {e}',
+                }
+            else:
+                result = {'status': 'done', 'version': self.app.db.version}
+            with self._lock:
+                job.update(result, finished=_now())
+                while len(self._jobs) > MAX_JOBS:
+                    oldest = next(iter(self._jobs.values()))
+                    if oldest['status'] in ('queued', 'running'):
+                        break
+                    del self._jobs[oldest['id']]
+                self._changed.notify_all()
+            self._save_job(job)
+
+    def _run_pull(self, job):
+        datadir = self.app.config['PYVO_DATADIR']
+
+        old_head_commit = _git('rev-parse', 'HEAD', cwd=datadir).strip()
+        output = _git('pull', cwd=datadir)
+        logger.info('Git output: %s', output)
+        head_commit = _git('rev-parse', 'HEAD', cwd=datadir).strip()
+        job['head'] = head_commit
+
+        if old_head_commit == head_commit:
+            job['note'] = 'unchanged'
+            return
+
+        output = _git(
+            'diff', '--name-only', '--no-renames', '-z',
+            old_head_commit, head_commit,
+            cwd=datadir,
+        )
+        changed_paths = [p for p in output.split('\0') if p]
+        self._run_update(job, changed_paths=changed_paths)
+
+    def _run_update(self, job, *, changed_paths):
+        config = self.app.config
+        logger.info('Changed files: %s', changed_paths)
+        job['changed_files'] = len(changed_paths)
+        db = update_data(
+            self.app.db, config['PYVO_DATADIR'], changed_paths,
+            snapshot=config['PYVO_SNAPSHOT'],
+            workers=config['PYVO_LOAD_WORKERS'],
+            validate=config['PYVO_VALIDATE_DATA'],
+            lazy_bodies=config['PYVO_LAZY_EVENT_BODIES'],
+        )
+        self._swap(db)
+        self._publish(db.version)
+        if self.master_pid is not None and self.master_pid != os.getpid():
+            prefork.request_reload(self.master_pid)
+
+    def _run_sync(self, job):
+        self.sync()
+
+    def sync(self):
+        """Load the latest data (from the snapshot, if used)"""
+        config = self.app.config
+        db = load_data(
+            config['PYVO_DATADIR'],
+            snapshot=config['PYVO_SNAPSHOT'],
+            workers=config['PYVO_LOAD_WORKERS'],
+            validate=config['PYVO_VALIDATE_DATA'],
+            lazy_bodies=config['PYVO_LAZY_EVENT_BODIES'],
+        )
+        self._swap(db)
+
+    def _swap(self, db):
+        from .views import pregenerate_qrcodes
+
+        app = self.app
+        get_search_index(db)
+        if app.config['PYVO_PREGENERATE_QRCODES']:
+            # QR codes of new events need to be ready before they're shown
+            pregenerate_qrcodes(app, db.events)
+        app.db = db
+        app.page_cache.clear()
+        self._save_worker()
+        if app.config['PYVO_WARM_UP']:
+            warm_up(app)
+
+    def _publish(self, version):
+        self._requested_version = version
+        self._write_state('generation', version)
+
+    def _read_generation(self):
+        try:
+            with open(self.state_dir / 'generation') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _save_worker(self):
+        if self.master_pid != os.getpid():
+            pid = os.getpid()
+            info = {
+                'pid': pid,
+                'version': self.app.db.version,
+                'updated': _now(),
+            }
+            self._write_state(f'workers/{pid}.json', json.dumps(info))
+            if self._worker_pid != pid:
+                self._worker_pid = pid
+                atexit.register(self._remove_worker, pid)
+
+    def _remove_worker(self, pid):
+        # Called at exit. Forked processes inherit the exit handler,
+        # but not the worker file.
+        if pid == os.getpid():
+            try:
+                (self.state_dir / 'workers' / f'{pid}.json').unlink(
+                    missing_ok=True,
+                )
+            except OSError:
+                pass
+
+    def _read_workers(self):
+        for path in sorted((self.state_dir / 'workers').glob('*.json')):
+            try:
+                with path.open() as f:
+                    info = json.load(f)
+                os.kill(info['pid'], 0)
+            except ProcessLookupError:
+                # Worker is gone
+                path.unlink(missing_ok=True)
+            except (OSError, ValueError, KeyError):
+                pass
+            else:
+                yield info
+
+    def _save_job(self, job):
+        jobs_dir = self.state_dir / 'jobs'
+        self._write_state(f'jobs/{job["id"]}.json', json.dumps(job))
+        try:
+            paths = sorted(
+                jobs_dir.glob('*.json'), key=lambda p: p.stat().st_mtime,
+            )
+        except FileNotFoundError:
+            # Another worker removed a file; leave cleanup to the next job
+            return
+        for path in paths[:-MAX_JOBS]:
+            path.unlink(missing_ok=True)
+
+    def _write_state(self, name, content):
+        try:
+            _write_atomic(self.state_dir / name, content)
+        except OSError:
+            logger.warning(
+                'Could not write reload state to %s', self.state_dir,
+                exc_info=True,
+            )
+
+
+def _git(*args, cwd):
+    import subprocess
+
+    output = subprocess.check_output(['git', *args], cwd=cwd)
+    return output.decode('utf-8')
+
+
+def _write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
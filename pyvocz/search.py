@@ -0,0 +1,252 @@
+"""Full-text search in events and talks
+
+The index maps each word to the events and talks that contain it.
+Words are compared after *folding*: lowercasing and removing diacritics,
+so "prednaska" finds "Přednáška". A query finds documents that contain
+all of its words; they are ranked by where the words occur (titles and
+speaker names count more than descriptions), then newest first.
+
+If details of events are loaded lazily, the index is built from talk
+summaries (see data.TalkSummary), and descriptions are not searched.
+
+Only the index for the most recently used data is kept; see
+get_search_index.
+"""
+
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import re
+import threading
+import unicodedata
+
+from attr import attrs
+
+
+# Weights of the fields of events and talks.
+# A document's score for a word is the sum of weights of the fields
+# that contain the word.
+EVENT_WEIGHTS = {
+    'title': 4,
+    'venue': 2,
+    'city': 2,
+    'description': 1,
+}
+TALK_WEIGHTS = {
+    'title': 4,
+    'speakers': 4,
+    'description': 1,
+    'event': 1,
+}
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    """Lowercase the text and remove diacritics"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def split_words(text):
+    """Return the set of folded words in the text"""
+    return set(WORD_RE.findall(fold(text)))
+
+
+@attrs(auto_attribs=True, slots=True)
+class Document:
+    """An event or talk that can be found"""
+
+    event: Any
+
+    # The talk (or its TalkSummary), or None if the document is the event
+    # itself
+    talk: Optional[Any] = None
+
+    @property
+    def kind(self):
+        return 'event' if self.talk is None else 'talk'
+
+    @property
+    def title(self):
+        if self.talk is None:
+            return self.event.title
+        return self.talk.title
+
+
+@attrs(auto_attribs=True, slots=True)
+class SearchResults:
+    """One page of results of a query"""
+
+    query: str
+    documents: List[Document]
+
+    # Number of all matching documents
+    total: int
+
+    page: int
+    per_page: int
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+
+@attrs(auto_attribs=True, slots=True)
+class SearchIndex:
+    """Inverted index of events and talks"""
+
+    # The data the index was built from
+    db: Any
+
+    # All documents, newest first; positions in this list are document IDs
+    documents: List[Document]
+
+    # For each word, the IDs of documents that contain it, sorted by
+    # rank: by score (descending), then newest first
+    ranked: Dict[str, List[int]]
+
+    # For each word, the IDs of all documents that contain it
+    doc_sets: Dict[str, FrozenSet[int]]
+
+    # For each word, the documents that contain it, grouped by score:
+    # a list of (score, IDs) pairs, highest score first
+    groups: Dict[str, List[Tuple[int, FrozenSet[int]]]]
+
+    @classmethod
+    def build(cls, db):
+        documents = []
+        scores = {}
+
+        def add(document, fields, weights):
+            doc_id = len(documents)
+            documents.append(document)
+            for field, text in fields.items():
+                if text:
+                    weight = weights[field]
+                    for word in split_words(text):
+                        doc_scores = scores.setdefault(word, {})
+                        doc_scores[doc_id] = doc_scores.get(doc_id, 0) + weight
+
+        # Descriptions are only available without loading event details
+        # if the details are not lazy
+        with_descriptions = db.event_bodies is None
+        for event in reversed(db.events):
+            venue_name = event.venue.name if event.venue else None
+            add(Document(event), {
+                'title': event.title,
+                'venue': venue_name,
+                'city': event.city.name,
+                'description':
+                    event.description if with_descriptions else None,
+            }, EVENT_WEIGHTS)
+            event_text = ' '.join(filter(None, (
+                event.title, venue_name, event.city.name,
+            )))
+            for talk in event.talk_summaries:
+                add(Document(event, talk), {
+                    'title': talk.title,
+                    'speakers': ' '.join(s.name for s in talk.speakers),
+                    'description':
+                        talk.description if with_descriptions else None,
+                    'event': event_text,
+                }, TALK_WEIGHTS)
+
+        ranked = {}
+        doc_sets = {}
+        groups = {}
+        for word, doc_scores in scores.items():
+            ranked[word] = sorted(doc_scores, key=lambda d: (-doc_scores[d], d))
+            doc_sets[word] = frozenset(doc_scores)
+            by_score = {}
+            for doc_id, score in doc_scores.items():
+                by_score.setdefault(score, set()).add(doc_id)
+            groups[word] = [
+                (score, frozenset(doc_ids))
+                for score, doc_ids in sorted(by_score.items(), reverse=True)
+            ]
+        return cls(
+            db=db, documents=documents,
+            ranked=ranked, doc_sets=doc_sets, groups=groups,
+        )
+
+    def search(self, query, *, page=1, per_page=20):
+        """Return the given page of results for a query (see SearchResults)"""
+        words = split_words(query)
+        start = (page - 1) * per_page
+        end = start + per_page
+        if not words or any(word not in self.ranked for word in words):
+            total = 0
+            doc_ids = []
+        elif len(words) == 1:
+            # The ranking is precomputed
+            [word] = words
+            total = len(self.ranked[word])
+            doc_ids = self.ranked[word][start:end]
+        else:
+            total, doc_ids = self._search_words(words, start, end)
+        return SearchResults(
+            query=query,
+            documents=[self.documents[d] for d in doc_ids],
+            total=total,
+            page=page,
+            per_page=per_page,
+        )
+
+    def _search_words(self, words, start, end):
+        """Find documents with all the words
+
+        Return the total number of them, and IDs of those ranked between
+        `start` and `end`.
+        """
+        # Split the matching documents into groups by total score:
+        # start with one group (with score 0) and split it by the groups
+        # of each word. Set operations do the per-document work.
+        words = sorted(words, key=lambda w: len(self.doc_sets[w]))
+        matching = self.doc_sets[words[0]].intersection(
+            *(self.doc_sets[word] for word in words[1:])
+        )
+        by_score = {0: matching}
+        for word in words:
+            groups = self.groups[word]
+            if len(groups) == 1:
+                # All documents get the same score for this word
+                [(score, _)] = groups
+                by_score = {
+                    total + score: doc_ids
+                    for total, doc_ids in by_score.items()
+                }
+                continue
+            new_by_score = {}
+            for total, doc_ids in by_score.items():
+                for score, word_doc_ids in groups:
+                    common = doc_ids & word_doc_ids
+                    if common:
+                        key = total + score
+                        if key in new_by_score:
+                            new_by_score[key] = new_by_score[key] | common
+                        else:
+                            new_by_score[key] = common
+            by_score = new_by_score
+
+        # Sort only the groups that overlap the requested page
+        result = []
+        position = 0
+        for score in sorted(by_score, reverse=True):
+            doc_ids = by_score[score]
+            if position + len(doc_ids) > start and position < end:
+                ranked = sorted(doc_ids)
+                result.extend(ranked[max(0, start - position):end - position])
+            position += len(doc_ids)
+        return len(matching), result
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index(db):
+    """Return the SearchIndex for the given data, building it if needed"""
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None or _search_index.db is not db:
+            _search_index = SearchIndex.build(db)
+        return _search_index
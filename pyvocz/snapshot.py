@@ -0,0 +1,136 @@
+"""Persistent cache of loaded data
+
+Loading the data directory means parsing hundreds of YAML files and
+validating the result, which takes a while. After a successful load,
+the resulting `Root` can be saved to a "snapshot" file, which is then used
+instead of the YAML files for as long as none of them change.
+
+A snapshot is only used if it matches the data *manifest*: the list of data
+files with their sizes and modification times. It also records a digest of
+the code that produces the pickled objects (the model, and the Markdown
+conversion along with the libraries it uses), so that a snapshot written
+by a different version of pyvocz is not used.
+
+The header also records whether the data was type-checked; loading with
+validation enabled does not use snapshots of data that wasn't.
+
+Failing to write a snapshot (for example, in a read-only directory) is
+not fatal; the data is then loaded from the YAML files again next time.
+
+Snapshots are pickles. Only load snapshots you wrote yourself!
+"""
+
+from pathlib import Path
+import hashlib
+import importlib.metadata
+import logging
+import os
+import pickle
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+# Bump this if the snapshot file format changes
+SNAPSHOT_FORMAT = 2
+
+# Modules whose code determines the pickled data
+_MODEL_MODULES = 'data.py', 'typecheck.py', 'markup.py'
+
+# Libraries whose output (or objects) are pickled
+_MODEL_LIBRARIES = 'markdown', 'markupsafe', 'python-dateutil'
+
+
+def manifest_digest(manifest):
+    """Return a digest of a manifest (as returned by data.data_manifest)"""
+    hasher = hashlib.sha256()
+    for name, size, mtime in manifest:
+        hasher.update(f'{name}\0{size}\0{mtime}\n'.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _code_digest():
+    """Return a digest of the code that produces the pickled data"""
+    hasher = hashlib.sha256()
+    for filename in _MODEL_MODULES:
+        hasher.update((Path(__file__).parent / filename).read_bytes())
+    for name in _MODEL_LIBRARIES:
+        try:
+            version = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        hasher.update(f'{name}\0{version}\n'.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _header(manifest, validated):
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'code': _code_digest(),
+        'manifest': manifest_digest(manifest),
+        'validated': validated,
+    }
+
+
+def save_snapshot(filename, root, manifest):
+    """Save `root`, loaded from files in `manifest`, into a snapshot file
+
+    The file is replaced atomically, so concurrent readers either see the
+    old snapshot or the new one.
+
+    Returns true if the snapshot was saved. Errors writing the file are
+    logged, not raised.
+    """
+    path = Path(filename)
+    try:
+        _write_snapshot(path, root, manifest)
+    except OSError:
+        logger.exception('Could not save snapshot %s', filename)
+        return False
+    return True
+
+
+def _write_snapshot(path, root, manifest):
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # The header is a separate pickle, so it can be checked without
+            # unpickling the whole data graph
+            header = _header(manifest, validated=root.validated)
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(root, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def load_snapshot(filename, manifest, *, validated=False):
+    """Load data from a snapshot file
+
+    Returns None if the snapshot does not exist, or if it does not match
+    the given manifest. If `validated` is true, also returns None if
+    the data in the snapshot was not type-checked.
+    """
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            header = pickle.load(f)
+            expected = _header(manifest, validated=header.get('validated'))
+            if header != expected:
+                logger.info('Snapshot %s is outdated', filename)
+                return None
+            if validated and not header['validated']:
+                logger.info('Snapshot %s was not type-checked', filename)
+                return None
+            return pickle.load(f)
+        except Exception:
+            # A broken snapshot is not fatal; the data will be loaded
+            # from the source files
+            logger.exception('Could not load snapshot %s', filename)
+            return None
@@ -0,0 +1,77 @@
+"""Measuring how long it takes to start the app
+
+`import_report` imports a module in a new Python process with
+`-X importtime`, and sums up the time spent importing each top-level
+package. `format_startup_report` formats it, together with the time
+it takes to create the app.
+"""
+
+import subprocess
+import sys
+
+
+def import_report(module='pyvocz.app'):
+    """Import `module` in a new process; return import times by package
+
+    The result is a dict with:
+    - 'total': time to import the module, including its dependencies
+    - 'packages': dict of top-level package names to time spent importing
+      the package's own modules (excluding other packages they import)
+    - 'modules': number of imported modules
+    All times are in seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE, check=True, encoding='utf-8',
+    )
+    # Lines are in post-order: modules that `module` imports (directly or
+    # indirectly) come just before it. Python's own start-up imports
+    # (like `site`) come before those, and are not counted.
+    entries = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        name = fields[2].strip()
+        entries.append((name, self_us))
+        if fields[2].startswith('  '):
+            # Nested import
+            continue
+        if name == module:
+            total = cumulative_us / 1e6
+            break
+        entries = []
+    packages = {}
+    for name, self_us in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us / 1e6
+    modules = len(entries)
+    return {'total': total, 'packages': packages, 'modules': modules}
+
+
+def format_startup_report(report, *, create_time=None, limit=20):
+    """Format the result of import_report as a table
+
+    `create_time` is the time it took to create the app, if known.
+    Only the `limit` slowest packages are listed.
+    """
+    lines = [f'{"Package":<24} {"Import time":>12}']
+    rows = sorted(report['packages'].items(), key=lambda item: -item[1])
+    for name, seconds in rows[:limit]:
+        lines.append(f'{name:<24} {seconds * 1000:10.1f}ms')
+    rest = sum(seconds for name, seconds in rows[limit:])
+    lines.append(f'{f"({len(rows[limit:])} others)":<24} {rest * 1000:10.1f}ms')
+    lines.append(
+        f'{"Total":<24} {report["total"] * 1000:10.1f}ms'
+        f' ({report["modules"]} modules)'
+    )
+    if create_time is not None:
+        lines.append(f'{"create_app":<24} {create_time * 1000:10.1f}ms')
+    return '\n'.join(lines)
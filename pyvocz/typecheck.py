@@ -11,96 +11,209 @@
 #
 # The code is not generic; it can be extended if more kinds of annotations are
 # added to the data model.
+#
+# For speed, each annotation is compiled into a checking function once
+# (see _compile), and each class gets a "plan": the checking functions for
+# its attributes (see _get_plan).
+# The path to an invalid object is only built when an error is found:
+# the error is an internal _ValidationError, to which each level adds
+# its path element as the exception propagates.
+#
+# A class can list attributes in `_typecheck_inline`; these are left out
+# of the path, so that private attributes that hold parts of an object
+# (like Event._body) don't show up in error messages.
 
 import typing
-import contextlib
 
-def typecheck(obj):
+def typecheck(obj, *, trusted=()):
     """Check that the given object corresponds to type hints
 
     Types are checked using class member annotations of obj's class.
     All of the instance's attributes must be typed, and types are checked
     recursively.
-    """
-    _TypeChecker().validate_hinted_attrs(obj)
 
+    Attributes of objects in `trusted` are assumed to be valid, and are
+    not checked.
+    """
+    memo = set(id(o) for o in trusted)
+    try:
+        _validate_hinted_attrs(obj, memo)
+    except _ValidationError as e:
+        raise e.exception_type(
+            f'{"".join(reversed(e.path))}: {e.message}'
+        ) from None
 
-class _TypeChecker:
-    """Internal class for holding state"""
-    path = ''
 
-    def __init__(self):
+class _ValidationError(Exception):
+    """Internal exception; converted to `exception_type` by typecheck"""
+    def __init__(self, exception_type, message):
+        self.exception_type = exception_type
+        self.message = message
 
-        # Path to object currently being handled
-        # The concatenation of path's elements will describe the object
+        # Path to the invalid object, innermost element first
         self.path = []
 
-        # Set of object IDs that were already checked
-        self.memo = set()
-
-    @contextlib.contextmanager
-    def recurse(self, path_elem):
-        """Context for handling an object"""
-        self.path.append(path_elem)
-        #print(f'Validating {"".join(self.path)}')
-        yield
-        self.path.pop()
-
-    def validate_hinted_attrs(self, obj):
-        """Validate all attributes of the given object"""
-        tp = type(obj)
-        if id(obj) in self.memo:
-            return
-        self.memo.add(id(obj))
-        type_hints = typing.get_type_hints(tp)
-        for attr_name, attr_type in type_hints.items():
-            value = getattr(obj, attr_name)
-            with self.recurse(f'.{attr_name}'):
-                self.validate_type(value, attr_type)
-        obj_dict = getattr(obj, '__dict__', None)
-        if obj_dict is not None:
-            extra_attrs = obj_dict.keys() - type_hints.keys()
-            if extra_attrs:
-                raise ValueError(
-                    f'{"".join(self.path)}: object has untyped attributes: ' +
-                    f'{extra_attrs}'
-                )
-
-    def validate_type(self, value, expected_type):
-        """Validate that `value` corresponds to the given type annotation"""
-        origin = getattr(expected_type, '__origin__', None)
-        if expected_type == typing.Any:
-            pass
-        elif origin in (dict, typing.Dict):
-            self.validate_type(value, dict)
-            key_type, val_type = expected_type.__args__
+
+# Cached plans:
+# type -> (list of (attribute name, checker, path element), check_extra)
+_plans = {}
+
+# Cached checking functions: annotation -> function
+_checkers = {}
+
+
+def _get_plan(tp):
+    """Return the validation plan for the given class"""
+    try:
+        return _plans[tp]
+    except KeyError:
+        pass
+    type_hints = typing.get_type_hints(tp)
+    inline = getattr(tp, '_typecheck_inline', ())
+    checks = [
+        (
+            attr_name,
+            _compile(attr_type),
+            '' if attr_name in inline else f'.{attr_name}',
+        )
+        for attr_name, attr_type in type_hints.items()
+    ]
+    checks = [check for check in checks if check[1] is not None]
+    # Objects with a __dict__ must not have untyped attributes;
+    # check_extra is the set of allowed names, or None if instances
+    # don't have a __dict__
+    if getattr(tp, '__dictoffset__', 0):
+        check_extra = frozenset(type_hints)
+    else:
+        check_extra = None
+    plan = _plans[tp] = checks, check_extra
+    return plan
+
+
+def _validate_hinted_attrs(obj, memo):
+    """Validate all attributes of the given object"""
+    checks, check_extra = _get_plan(type(obj))
+    if not checks and check_extra is None:
+        # Nothing to check (e.g. datetime)
+        return
+    if id(obj) in memo:
+        return
+    memo.add(id(obj))
+    for attr_name, check, path_element in checks:
+        try:
+            check(getattr(obj, attr_name), memo)
+        except _ValidationError as e:
+            e.path.append(path_element)
+            raise
+    if check_extra is not None:
+        extra_attrs = obj.__dict__.keys() - check_extra
+        if extra_attrs:
+            raise _ValidationError(
+                ValueError,
+                f'object has untyped attributes: {extra_attrs}',
+            )
+
+
+def _compile(expected_type):
+    """Return a function that validates values of the given annotation
+
+    The function takes the value and the memo (set of IDs of objects that
+    don't need checking). None is returned for annotations that
+    allow anything.
+    """
+    try:
+        return _checkers[expected_type]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable annotation
+        return _make_checker(expected_type)
+    check = _checkers[expected_type] = _make_checker(expected_type)
+    return check
+
+
+def _make_checker(expected_type):
+    origin = getattr(expected_type, '__origin__', None)
+    if expected_type == typing.Any:
+        return None
+    elif origin in (dict, typing.Dict):
+        key_type, val_type = expected_type.__args__
+        check_key = _compile(key_type) or _check_nothing
+        check_val = _compile(val_type) or _check_nothing
+
+        def check_dict(value, memo):
+            if not isinstance(value, dict):
+                raise _not_a(value, dict)
             for key, val in value.items():
-                with self.recurse(f' key {key!r}'):
-                    self.validate_type(key, key_type)
-                with self.recurse(f'[{key!r}]'):
-                    self.validate_type(val, val_type)
-        elif origin in (list, typing.List):
-            self.validate_type(value, list)
-            [item_type] = expected_type.__args__
+                try:
+                    check_key(key, memo)
+                except _ValidationError as e:
+                    e.path.append(f' key {key!r}')
+                    raise
+                try:
+                    check_val(val, memo)
+                except _ValidationError as e:
+                    e.path.append(f'[{key!r}]')
+                    raise
+        return check_dict
+    elif origin in (list, typing.List):
+        [item_type] = expected_type.__args__
+        check_item = _compile(item_type) or _check_nothing
+
+        def check_list(value, memo):
+            if not isinstance(value, list):
+                raise _not_a(value, list)
             for i, item in enumerate(value):
-                with self.recurse(f'[{i}]'):
-                    self.validate_type(item, item_type)
-        elif origin == typing.Union:
+                try:
+                    check_item(item, memo)
+                except _ValidationError as e:
+                    e.path.append(f'[{i}]')
+                    raise
+        return check_list
+    elif origin == typing.Union:
+        options = [
+            _compile(option) or _check_nothing
+            for option in expected_type.__args__
+        ]
+        if type(None) in expected_type.__args__ and len(options) == 2:
+            # Optional[...]: check for None first
+            [check_other] = [
+                check for option, check
+                in zip(expected_type.__args__, options)
+                if option is not type(None)
+            ]
+
+            def check_optional(value, memo):
+                if value is not None:
+                    check_other(value, memo)
+            return check_optional
+
+        def check_union(value, memo):
             exception_to_raise = None
-            for option in expected_type.__args__:
+            for check in options:
                 try:
-                    self.validate_type(value, option)
-                except TypeError as e:
+                    check(value, memo)
+                except _ValidationError as e:
+                    if e.exception_type is not TypeError:
+                        raise
                     if exception_to_raise is None:
                         exception_to_raise = e
                 else:
                     return
-            else:
-                raise exception_to_raise
-        else:
+            raise exception_to_raise
+        return check_union
+    else:
+        def check_instance(value, memo):
             if not isinstance(value, expected_type):
-                raise TypeError(
-                    f'{"".join(self.path)}: {value} is not a {expected_type}'
-                )
+                raise _not_a(value, expected_type)
             if not isinstance(value, (int, str)):
-                self.validate_hinted_attrs(value)
+                _validate_hinted_attrs(value, memo)
+        return check_instance
+
+
+def _check_nothing(value, memo):
+    pass
+
+
+def _not_a(value, expected_type):
+    return _ValidationError(TypeError, f'{value} is not a {expected_type}')
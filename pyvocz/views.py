@@ -1,24 +1,24 @@
 import datetime
-import subprocess
+import functools
+import hashlib
+import itertools
 import json
 import re
-from bisect import bisect
 
 from io import BytesIO
 
-import ics
-import qrcode
-
-from dateutil.relativedelta import relativedelta
 from flask import request, Response, url_for, redirect, g, abort
-from flask import render_template, jsonify
+from flask import render_template, jsonify, stream_with_context
+from werkzeug.http import http_date
 from flask import current_app as app
-from cachelib import SimpleCache
 
 from . import filters
 from .calendar import get_calendar
-from .data import load_data
 from .event_add import event_add_link
+from .homepage import get_homepage
+from .ical import generate_ics
+from .search import get_search_index
+from .metrics import timed
 
 
 BACKCOMPAT_SERIES_ALIASES = {
@@ -31,11 +31,6 @@ BACKCOMPAT_SERIES_ALIASES = {
 }
 
 
-# Be careful when using SimpleCache!
-# See: http://werkzeug.pocoo.org/docs/contrib/cache/
-#      #werkzeug.contrib.cache.SimpleCache
-cache = SimpleCache(threshold=500, default_timeout=300)
-
 routes = []
 
 
@@ -58,57 +53,83 @@ def route(url, methods=['GET'], translate=True, **kwargs):
     return decorator
 
 
-@route('/')
-def index():
-    db = app.db
-    now = datetime.datetime.now(tz=db.default_timezone)
-    today = now.date()
-
-    # Series with latest events
-    # Split series into "featured" (recent) and "past" which last took
-    # place 6+ months ago.
-
-    featured_events = []
-    past_events = []
-    for series in db.series.values():
-        keys = [event.date for event in series.events]
-        best_event_index = bisect(keys, today)
-        if best_event_index >= len(keys):
-            last_event = series.events[-1]
-            if (today - last_event.date).days > 31*6:
-                past_events.append(last_event)
-            else:
-                featured_events.append(last_event)
-        else:
-            featured_events.append(series.events[best_event_index])
+def cached_page(func):
+    """Cache HTML pages rendered by the decorated view
+
+    Pages are cached in app.page_cache, keyed by the view, its arguments,
+    the language, the scheme and host of the request (pages contain
+    absolute URLs), the current date, and the data version. (The query
+    string is not part of the key; cached views must not use it.)
+    Responses carry an ETag, so clients that already have the page get
+    a 304.
+
+    Responses that aren't rendered pages (like redirects) are not cached.
+    """
+    @functools.wraps(func)
+    def wrapper(**kwargs):
+        if not app.config['PYVO_PAGE_CACHE']:
+            return func(**kwargs)
+        db = app.db
+        # Pages use both the local date and the date in Prague
+        key = repr((
+            request.endpoint,
+            sorted(request.view_args.items()),
+            g.lang_code,
+            request.host_url,
+            datetime.date.today(),
+            datetime.datetime.now(tz=db.default_timezone).date(),
+            db.version,
+        ))
+        cached = get_cached_body(key)
+        if cached is None:
+            result = func(**kwargs)
+            if not isinstance(result, str):
+                return result
+            cached = set_cached_body(key, result.encode('utf-8'))
+        body, etag = cached
+        return conditional_response(body, etag, mimetype='text/html')
+    return wrapper
+
+
+def get_cached_body(key):
+    """Get a (body, etag) pair from app.page_cache, or None if not cached"""
+    cached = app.page_cache.get(key)
+    if cached is None:
+        return None
+    # The cache stores the ETag and body together
+    etag, body = cached.split(b' ', 1)
+    return body, etag.decode('ascii')
+
+
+def set_cached_body(key, body):
+    """Store a body in app.page_cache; return a (body, etag) pair"""
+    etag = hashlib.sha1(body).hexdigest()
+    app.page_cache.set(key, etag.encode('ascii') + b' ' + body)
+    return body, etag
+
+
+def conditional_response(body, etag, *, mimetype, last_modified=None):
+    """Return a response that can be a 304 if the client has it already"""
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response.make_conditional(request)
 
-    # order to show meetups in: upcoming first, then by distance from today
-    featured_events.sort(key=lambda e: (e.date < today, today - e.date))
-    past_events.sort(key=lambda e: e.date, reverse=True)
 
-    videos = get_videos(db.events)
-
-    calendar = get_calendar(
-        db, first_year=today.year, first_month=today.month - 1, num_months=3,
+@route('/')
+@cached_page
+def index():
+    homepage = get_homepage(app.db)
+    return render_template(
+        'index.html',
+        featured_events=homepage.featured_events,
+        past_events=homepage.past_events,
+        today=homepage.today,
+        videos=homepage.videos,
+        calendar=homepage.calendar,
     )
 
-    return render_template('index.html', featured_events=featured_events,
-                           past_events=past_events,
-                           today=today, videos=videos, calendar=calendar)
-
-
-def get_videos(events, max_len=12):
-    """Get `max_len` latest videos"""
-    videos = []
-    for event in reversed(events):
-        for talk in event.talks:
-            for link in talk.links:
-                if link.kind == 'video':
-                    videos.append(link)
-                    if len(videos) >= max_len:
-                        return videos
-    return videos
-
 
 def min_max_years(events):
     return events[0].date.year, events[-1].date.year
@@ -116,6 +137,7 @@ def min_max_years(events):
 
 @route('/calendar/', defaults={'year': None})
 @route('/calendar/<int:year>/')
+@cached_page
 def calendar(year=None):
     db = app.db
     today = datetime.date.today()
@@ -142,6 +164,7 @@ def calendar(year=None):
 @route('/<series_slug>/')
 @route('/<series_slug>/<int:year>/')
 @route('/<series_slug>/<any(all):all>/')
+@cached_page
 def series(series_slug, year=None, all=None):
     db = app.db
 
@@ -158,7 +181,7 @@ def series(series_slug, year=None, all=None):
 
     # List of years to show in the pagination
     # If there are no years with events, put the current year there at least
-    all_years = sorted(set(event.date.year for event in series.events))
+    all_years = list(series.years)
     if all_years:
         first_year = min(all_years)
         last_year = max(all_years)
@@ -178,16 +201,19 @@ def series(series_slug, year=None, all=None):
             # Otherwise, if there are no events in requested year, return 404.
             abort(404)
 
-    all_events = list(reversed(series.events))
-
     if all:
-        events = all_events
+        events = list(reversed(series.events))
     else:
         if year is None:
             # The 'New' page displays the current year as well as the last one
-            events = [e for e in all_events if e.date.year >= today.year - 1]
+            years = [y for y in series.years if y >= today.year - 1]
         else:
-            events = [e for e in all_events if e.date.year == year]
+            years = [year]
+        events = [
+            e
+            for y in reversed(years)
+            for e in reversed(series.events_by_year[y])
+        ]
 
     # Split events between future and past
     # (today's event, if any, is considered future)
@@ -199,7 +225,9 @@ def series(series_slug, year=None, all=None):
         # On the home page of the series, if there are no recent enough
         # past events, show up to 5 last ones.
         new_history = False
-        past_events = [e for e in all_events if e.date < today][:5]
+        past_events = list(itertools.islice(
+            (e for e in reversed(series.events) if e.date < today), 5,
+        ))
 
     if all is not None:
         paginate_prev = {'year': first_year}
@@ -249,8 +277,8 @@ def series(series_slug, year=None, all=None):
 
 
 @route('/<series_slug>/<date_slug>/')
+@cached_page
 def event(series_slug, date_slug):
-    db = app.db
     if series_slug in BACKCOMPAT_SERIES_ALIASES:
         url = url_for('event',
                       series_slug=BACKCOMPAT_SERIES_ALIASES[series_slug],
@@ -259,7 +287,27 @@ def event(series_slug, date_slug):
 
     today = datetime.date.today()
 
-    series = db.series.get(series_slug)
+    event = find_event(series_slug, date_slug)
+
+    proper_date_slug = '{0.year:4}-{0.month:02}'.format(event.date)
+    if date_slug != proper_date_slug:
+        return redirect(url_for('event', series_slug=series_slug,
+                                date_slug=proper_date_slug))
+
+    github_link = ("https://github.com/pyvec/pyvo-data/blob/master/./"
+                   "{filepath}".format(filepath=event._source))
+
+    return render_template('event.html', event=event, today=today,
+                           github_link=github_link)
+
+
+def find_event(series_slug, date_slug):
+    """Return the event identified by URL arguments, or abort with 404
+
+    `date_slug` is either the year and month (YYYY-MM, or YYYY-M),
+    or the number of the event.
+    """
+    series = app.db.series.get(series_slug)
     if not series:
         abort(404)
 
@@ -269,47 +317,114 @@ def event(series_slug, date_slug):
             number = int(date_slug)
         except ValueError:
             abort(404)
-        events = [e for e in series.events if e.number == number]
+        event = series.events_by_number.get(number)
     else:
         year = int(match.group(1))
         month = int(match.group(2))
-        events = [
-            e for e in series.events
-            if e.date.year == year and e.date.month == month
-        ]
+        event = series.events_by_slug.get(f'{year:04}-{month:02}')
 
-    if len(events) != 1:
+    if event is None:
         abort(404)
-    [event] = events
+    return event
 
-    proper_date_slug = '{0.year:4}-{0.month:02}'.format(event.date)
-    if date_slug != proper_date_slug:
-        return redirect(url_for('event', series_slug=series_slug,
-                                date_slug=proper_date_slug))
 
-    github_link = ("https://github.com/pyvec/pyvo-data/blob/master/./"
-                   "{filepath}".format(filepath=event._source))
+@route('/<series_slug>/<date_slug>/qrcode.png')
+def event_qrcode(series_slug, date_slug):
+    # QR codes are only served if they were pregenerated
+    # (see pregenerate_qrcodes)
+    event = find_event(series_slug, date_slug)
+    png = app.qrcode_cache.get(qrcode_key(event, g.lang_code))
+    if png is None:
+        abort(404)
+    return Response(png, mimetype='image/png')
 
-    return render_template('event.html', event=event, today=today,
-                           github_link=github_link)
 
+def qrcode_key(event, lang_code):
+    """Return the key of an event's QR code in app.qrcode_cache"""
+    return repr((
+        app.config['PYVO_BASE_URL'], lang_code, event.series.slug, event.slug,
+    ))
 
-@route('/<series_slug>/<date_slug>/qrcode.png')
-def event_qrcode(series_slug, date_slug):
-    url = url_for('event', _external=True,
-                  series_slug=series_slug, date_slug=date_slug)
 
-    qr_byte_io = cache.get(url)
-    if qr_byte_io is None:
-        qr_img = qrcode.make(url,
-                             box_size=5,
-                             border=0)
-        qr_byte_io = BytesIO()
-        qr_img.save(qr_byte_io, 'PNG')
-        qr_byte_io.seek(0)
-        cache.set(url, qr_byte_io, timeout=5 * 60)
+def make_qrcode(url):
+    """Return a PNG image (as bytes) of a QR code for the given URL"""
+    # qrcode (and Pillow) are slow to import; only load them when needed
+    import qrcode
+
+    qr_img = qrcode.make(url,
+                         box_size=5,
+                         border=0)
+    qr_byte_io = BytesIO()
+    qr_img.save(qr_byte_io, 'PNG')
+    return qr_byte_io.getvalue()
+
+
+def pregenerate_qrcodes(flask_app, events=None):
+    """Put QR codes for events into the cache, if they're not there yet
+
+    By default, QR codes for all events are generated. The encoded URLs
+    are built for the app's PYVO_BASE_URL.
+    """
+    base_url = flask_app.config['PYVO_BASE_URL']
+    with flask_app.test_request_context(base_url=base_url):
+        if events is None:
+            events = app.db.events
+        for event in events:
+            for lang_code in 'cs', 'en':
+                key = qrcode_key(event, lang_code)
+                if app.qrcode_cache.get(key) is None:
+                    url = url_for('event', _external=True, lang_code=lang_code,
+                                  series_slug=event.series.slug,
+                                  date_slug=event.slug)
+                    app.qrcode_cache.set(key, make_qrcode(url))
+
+
+# Maximum number of search results per page
+MAX_SEARCH_RESULTS = 100
+
 
-    return Response(qr_byte_io, mimetype='image/png')
+def search_results():
+    """Search for the `q` query argument; return SearchResults
+
+    The `page` and `per_page` arguments select the page of results.
+    """
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    if page < 1 or not 1 <= per_page <= MAX_SEARCH_RESULTS:
+        abort(400)
+    index = get_search_index(app.db)
+    return index.search(query, page=page, per_page=per_page)
+
+
+@route('/search/')
+def search():
+    return render_template('search.html', results=search_results())
+
+
+@route('/api/search.json', translate=False)
+def api_search():
+    results = search_results()
+    return jsonify({
+        'query': results.query,
+        'total': results.total,
+        'page': results.page,
+        'per_page': results.per_page,
+        'results': [
+            {
+                'type': document.kind,
+                'title': document.title,
+                'url': filters.event_url(document.event, _external=True),
+                'date': document.event.date.isoformat(),
+                'series': document.event.series.slug,
+                'event': document.event.title,
+                'speakers': [
+                    speaker.name for speaker in document.talk.speakers
+                ] if document.talk else [],
+            }
+            for document in results.documents
+        ],
+    })
 
 
 @route('/code-of-conduct/')
@@ -342,71 +457,30 @@ def api_venue_geojson(venueslug):
     })
 
 
-def make_ics(events_in, url, *, recurrence_series=()):
-    today = datetime.date.today()
-
-    events = []
-    last_series_date = {}
+def make_ics(events, *, recurrence_series=()):
+    """Generate an iCalendar feed of the given events, as strings"""
+    if g.lang_code == 'cs':
+        tentative_name = '({} – nepotvrzeno; tradiční termín srazu)'
+    else:
+        tentative_name = '({} – tentative date)'
 
-    for event in events_in:
-        if event.venue:
-            location = '{}, {}, {}'.format(
-                event.venue.name,
-                event.venue.short_address,
-                event.city.name,
-            )
-            geo_obj = event.venue
-        else:
-            location = event.city.name
-            geo_obj = event.city.location
-        cal_event = ics.Event(
-            name=event.title,
-            location=location,
-            begin=event.start,
-            uid='{}-{}@pyvo.cz'.format(event.series.slug, event.date),
-            url=url_for(
-                'event', series_slug=event.series.slug,
-                date_slug=event.slug,
-                _external=True,
-            ),
-            description=event.description,
+    def event_url(event):
+        return url_for(
+            'event', series_slug=event.series.slug,
+            date_slug=event.slug,
+            _external=True,
         )
-        cal_event.geo = float(geo_obj.latitude), float(geo_obj.longitude)
-        events.append(cal_event)
-
-        if (
-            event.series.slug in last_series_date
-            and last_series_date[event.series.slug] < event.date
-        ):
-            last_series_date[event.series.slug] = event.date
-
-    # XXX: We should use the Series recurrence rule directly,
-    # but ics doesn't allow that yet:
-    # https://github.com/C4ptainCrunch/ics.py/issues/14
-    # Just show the events for the next 6 months (with the limit at a month
-    # boundary).
-    occurence_limit = (today + relativedelta(months=+6)).replace(day=1)
-
-    for series in recurrence_series:
-        since = last_series_date.get(series.slug, today)
-        since += datetime.timedelta(days=1)
-
-        if g.lang_code == 'cs':
-            name_template = '({} – nepotvrzeno; tradiční termín srazu)'
-        else:
-            name_template = '({} – tentative date)'
-        for occurence in series.next_occurrences(since=since):
-            if occurence.date() > occurence_limit:
-                break
-            cal_event = ics.Event(
-                name=name_template.format(series.name),
-                begin=occurence,
-                uid='{}-{}@pyvo.cz'.format(series.slug, occurence.date()),
-                categories=['tentative-date'],
-            )
-            events.append(cal_event)
 
-    return ics.Calendar(events=events)
+    return generate_ics(
+        events,
+        event_url=event_url,
+        dtstamp=app.db.modified,
+        recurrence_series=recurrence_series,
+        tentative_name=tentative_name,
+        # With lazy event details, descriptions would load details of all
+        # the events (and unload the ones that pages need)
+        descriptions=app.db.event_bodies is None,
+    )
 
 
 def make_feed(events, url):
@@ -423,7 +497,9 @@ def make_feed(events, url):
         fe.id(url)
         fe.link(href=url, rel='alternate')
         fe.title(event.title)
-        fe.summary(event.description)
+        # Descriptions of lazily loaded events are left out; see make_ics
+        if app.db.event_bodies is None:
+            fe.summary(event.description)
         fe.published(event.start)
         fe.updated(event.start)
         # XXX: Put talks into fe.dscription(),
@@ -432,17 +508,32 @@ def make_feed(events, url):
 
 
 def feed_response(events, feed_type, *, recurrence_series=()):
+    """Return a feed of the given events
+
+    Feeds are cached in app.page_cache, keyed by the view, its arguments
+    (including the parsed query arguments), the language, the scheme and
+    host of the request, and the data version, and for ICS (which includes
+    tentative future dates) also the date.
+
+    ICS feeds that aren't cached yet are streamed. The ETag of a body is
+    only known when it's complete, so such responses have no ETag, only
+    Last-Modified (which clients can use to revalidate, too). Responses
+    served from the cache have both.
+
+    The `since` (ISO date) and `limit` query arguments can be used to
+    only get events since the given date, and/or only the given number
+    of latest events.
+    """
+    db = app.db
     MIMETYPES = {
         'rss': 'application/rss+xml',
         'atom': 'application/atom+xml',
         'ics': 'text/calendar',
     }
     FEED_MAKERS = {
-        'rss': lambda: make_feed(events, request.url).rss_str(pretty=True),
-        'atom': lambda: make_feed(events, request.url).atom_str(pretty=True),
-        'ics': lambda: str(make_ics(
-            events, request.url, recurrence_series=recurrence_series),
-        ),
+        'rss': lambda: make_feed(events, feed_url).rss_str(pretty=True),
+        'atom': lambda: make_feed(events, feed_url).atom_str(pretty=True),
+        'ics': lambda: make_ics(events, recurrence_series=recurrence_series),
     }
 
     try:
@@ -451,7 +542,80 @@ def feed_response(events, feed_type, *, recurrence_series=()):
     except KeyError:
         abort(404)
 
-    return Response(maker(), mimetype=mimetype)
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            since = datetime.date.fromisoformat(since)
+        limit = request.args.get('limit')
+        if limit is not None:
+            limit = int(limit)
+            if limit < 0:
+                raise ValueError(limit)
+    except ValueError:
+        abort(400)
+    query = {}
+    if since is not None:
+        query['since'] = since.isoformat()
+    if limit is not None:
+        query['limit'] = limit
+    # The feed's own URL, without any other query arguments
+    feed_url = url_for(
+        request.endpoint, _external=True, **request.view_args, **query,
+    )
+    if since is not None:
+        events = [e for e in events if e.date >= since]
+    if limit is not None:
+        events = events[len(events) - limit:] if limit else []
+
+    last_modified = db.modified
+    key_parts = (
+        request.endpoint, sorted(request.view_args.items()), g.lang_code,
+        request.host_url, sorted(query.items()), db.version,
+    )
+    if feed_type == 'ics':
+        today = datetime.date.today()
+        key = repr((*key_parts, today))
+        midnight = datetime.datetime.combine(
+            today, datetime.time(), tzinfo=db.default_timezone,
+        )
+        if last_modified is None or last_modified < midnight:
+            last_modified = midnight
+    else:
+        key = repr(key_parts)
+
+    cached = get_cached_body(key)
+    if cached is None:
+        with timed('feed'):
+            body = maker()
+        if not isinstance(body, bytes):
+            # Stream the body, and cache it when it's complete
+            response = Response(
+                stream_with_context(_stream_and_cache(key, body)),
+                mimetype=mimetype,
+                headers={'Last-Modified': http_date(last_modified)},
+            )
+            return response.make_conditional(request)
+        cached = set_cached_body(key, body)
+    body, etag = cached
+    return conditional_response(
+        body, etag, mimetype=mimetype, last_modified=last_modified,
+    )
+
+
+def _stream_and_cache(key, chunks):
+    body = []
+    chunks = iter(chunks)
+    while True:
+        # Time generating the chunks, but not sending them
+        with timed('feed'):
+            chunk = next(chunks, None)
+            if chunk is not None:
+                chunk = chunk.encode('utf-8')
+        if chunk is None:
+            break
+        body.append(chunk)
+        yield chunk
+    set_cached_body(key, b''.join(body))
 
 
 @route('/api/pyvo.<feed_type>')
@@ -472,8 +636,7 @@ def api_series_feed(series_slug, feed_type):
     return feed_response(series.events, feed_type, recurrence_series=[series])
 
 
-@route('/api/reload_hook', methods=['POST'])
-def reload_hook():
+def check_pull_password():
     # Some really lame password protection (against DoS)
     if app.config['PYVO_PULL_PASSWORD'] is None:
         abort(404, "pull hook not configured")
@@ -483,24 +646,28 @@ def reload_hook():
     except (TypeError, KeyError):
         abort(500, "missing password")
 
-    datadir = app.config['PYVO_DATADIR']
-
-    output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=datadir)
-    old_head_commit = output.decode('ascii').strip()
 
-    output = subprocess.check_output(['git', 'pull'], cwd=datadir)
-    app.logger.info('Git output: %s', str(output))
+@route('/api/reload_hook', methods=['POST'])
+def reload_hook():
+    check_pull_password()
 
-    output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=datadir)
-    head_commit = output.decode('ascii').strip()
+    # The data is pulled and loaded in the background; see pyvocz.reload
+    # (The status is at reload_status, which also needs the password)
+    job = app.reloader.enqueue('pull')
+    return jsonify({'result': 'OK', 'job': job['id']}), 202
 
-    if old_head_commit == head_commit:
-        return jsonify({'result': 'OK', 'HEAD': head_commit,
-                        'note': 'unchanged'})
 
-    app.db = load_data(datadir)
+@route('/api/reload_status')
+def reload_status():
+    check_pull_password()
 
-    return jsonify({'result': 'OK', 'HEAD': head_commit})
+    result = app.reloader.status()
+    job_id = request.args.get('job')
+    if job_id is not None:
+        result['job'] = app.reloader.get_job(job_id)
+        if result['job'] is None:
+            abort(404, "unknown job")
+    return jsonify(result)
 
 
 @route('/', subdomain='<subdomain>')
@@ -0,0 +1,45 @@
+"""Warming up a worker before it serves requests
+
+Without warming up, the first requests a worker handles compile
+templates and compute calendars, and are much slower than the rest.
+`warm_up` does that work in advance.
+
+Compiled templates can also be kept in a bytecode cache directory
+(PYVO_TEMPLATE_CACHE_DIR), so that new worker processes load them
+instead of compiling again.
+"""
+
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(app):
+    """Compile all templates, and render the most used pages
+
+    The pages are the homepage, the calendar and the page of each series,
+    in all languages. They're stored in the page cache.
+    """
+    start = time.perf_counter()
+    env = app.jinja_env
+    templates = env.list_templates(filter_func=lambda n: n.endswith('.html'))
+    for name in templates:
+        env.get_template(name)
+
+    urls = ['/', '/calendar/']
+    urls.extend(f'/{slug}/' for slug in app.db.series)
+    client = app.test_client()
+    for url in urls:
+        for prefix in '', '/en':
+            response = client.get(prefix + url)
+            if response.status_code != 200:
+                logger.warning(
+                    'Warm-up request to %s failed: %s',
+                    prefix + url, response.status,
+                )
+    logger.info(
+        'Warmed up in %.3fs (%s templates, %s pages)',
+        time.perf_counter() - start, len(templates), len(urls) * 2,
+    )
@@ -0,0 +1,144 @@
+"""Watching the data directory for changes
+
+A watcher thread collects the names of changed data files. Once the
+changes stop for DEBOUNCE_DELAY seconds, it queues an 'update' job
+(see pyvocz.reload), which re-reads only the changed files into a new
+Root. If the changed data can't be loaded, the error is logged and the
+app keeps serving the old data.
+
+Changes are detected with inotify if the `inotify_simple` module is
+installed (on Linux). Otherwise, the directory is polled every
+POLL_INTERVAL seconds.
+"""
+
+from pathlib import Path
+import logging
+import threading
+import time
+
+from .data import data_manifest
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+logger = logging.getLogger(__name__)
+
+# Time without changes to wait before reloading, in seconds
+DEBOUNCE_DELAY = 0.5
+
+# Time between scans of the data directory when polling, in seconds
+POLL_INTERVAL = 1
+
+
+def start_watching(app, *, use_inotify=True):
+    """Start watching the app's data directory in a background thread"""
+    datadir = Path(app.config['PYVO_DATADIR'])
+    if use_inotify and inotify_simple is not None:
+        target = _watch_inotify
+    else:
+        target = _watch_polling
+    logger.info('Watching %s for changes (%s)', datadir, target.__name__)
+    thread = threading.Thread(
+        target=target, args=(app, datadir),
+        name='pyvocz-watcher', daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _reload(app, changed_paths):
+    changed_paths = sorted(changed_paths)
+    logger.info('Data files changed: %s', changed_paths)
+    app.reloader.enqueue('update', changed_paths=changed_paths)
+
+
+def _watch_polling(app, datadir):
+    def scan():
+        return {
+            name: (size, mtime)
+            for name, size, mtime in data_manifest(datadir)
+        }
+
+    files = scan()
+    changed_paths = set()
+    while True:
+        time.sleep(DEBOUNCE_DELAY if changed_paths else POLL_INTERVAL)
+        try:
+            new_files = scan()
+        except OSError:
+            # Files were removed during the scan; try again later
+            continue
+        changes = {
+            name for name in files.keys() | new_files.keys()
+            if files.get(name) != new_files.get(name)
+        }
+        files = new_files
+        if changes:
+            changed_paths.update(changes)
+        elif changed_paths:
+            _reload(app, changed_paths)
+            changed_paths = set()
+
+
+def _watch_inotify(app, datadir):
+    flags = inotify_simple.flags
+    watch_flags = (
+        flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE
+        | flags.MOVED_FROM | flags.MOVED_TO
+    )
+    inotify = inotify_simple.INotify()
+    directories = {}
+
+    def add_watch(directory):
+        """Watch a directory and its subdirectories; yield files in them"""
+        if directory.name.startswith('.'):
+            return
+        wd = inotify.add_watch(directory, watch_flags)
+        directories[wd] = directory
+        for child in directory.iterdir():
+            if child.is_dir():
+                yield from add_watch(child)
+            else:
+                yield child
+
+    # Names of all watched files, relative to datadir
+    known = {p.relative_to(datadir).as_posix() for p in add_watch(datadir)}
+
+    changed_paths = set()
+    while True:
+        timeout = DEBOUNCE_DELAY * 1000 if changed_paths else None
+        events = inotify.read(timeout=timeout)
+        if not events and changed_paths:
+            _reload(app, changed_paths)
+            changed_paths = set()
+        for event in events:
+            directory = directories.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            if event.name.startswith('.'):
+                continue
+            path = directory / event.name
+            name = path.relative_to(datadir).as_posix()
+            removed = event.mask & (flags.DELETE | flags.MOVED_FROM)
+            if event.mask & flags.ISDIR:
+                if removed:
+                    # All the files that were in the directory are gone
+                    gone = {n for n in known if n.startswith(name + '/')}
+                    known -= gone
+                    changed_paths.update(gone)
+                else:
+                    new_names = {
+                        p.relative_to(datadir).as_posix()
+                        for p in add_watch(path)
+                    }
+                    known.update(new_names)
+                    changed_paths.update(new_names)
+            else:
+                if removed:
+                    known.discard(name)
+                else:
+                    known.add(name)
+                changed_paths.add(name)
@@ -56,12 +56,10 @@ setup_args = dict(
     install_requires=[
         'flask >= 2.0, < 3.0',
         'docopt >= 0.6, < 1.0',
-        'ics >= 0.6, < 1.0',
         'feedgen >= 0.3.1, < 1.0',
         'markdown >= 3.1.1, < 4.0',
         'Pillow >= 10.0.0, < 11.0.0',
         'qrcode >= 7.0, < 8.0',
-        'cachelib >= 0.1, <1.0',
         'attrs >= 23.0, <24.0',
         'czech_holidays >= 0.2.0, < 1.0',
         'python-dateutil >= 2.8, <3.0',
@@ -72,6 +70,9 @@ setup_args = dict(
 
     extras_require={
         'test': tests_require,
+        'bench': ['ics >= 0.6, < 1.0'],
+        'watch': ['inotify_simple >= 1.3, < 3.0'],
+        'prefork': ['gunicorn >= 20.1, < 23.0'],
     },
 
     tests_require=tests_require,
@@ -14,6 +14,9 @@ def pytest_addoption(parser):
     parser.addoption(
         "--all-data", action="store_true",
         help="Load all the meetup data, not just a testing subset.")
+    parser.addoption(
+        "--load-workers", type=int, default=None,
+        help="Number of processes to parse the meetup data with.")
 
 
 @pytest.fixture
@@ -24,8 +27,10 @@ def check_external_links(pytestconfig):
 @pytest.fixture
 def app(pytestconfig):
     src = DEFAULT_DATA_DIR
+    load_workers = pytestconfig.getoption('load_workers')
     if pytestconfig.getoption('all_data'):
-        yield create_app(datadir=src, echo=False)
+        yield create_app(datadir=src, echo=False, load_workers=load_workers,
+                         config={'PYVO_PREGENERATE_QRCODES': True})
     else:
         with tempfile.TemporaryDirectory() as tempdir:
             for name in """
@@ -70,4 +75,6 @@ def app(pytestconfig):
                         os.path.join(src, name),
                         os.path.join(tempdir, name),
                     )
-            yield create_app(datadir=tempdir, echo=False)
+            yield create_app(datadir=tempdir, echo=False,
+                             load_workers=load_workers,
+                             config={'PYVO_PREGENERATE_QRCODES': True})
@@ -0,0 +1,52 @@
+import pytest
+
+from pyvocz.caches import MemoryCache, FileCache, ChainCache
+
+
+def test_memory_cache_limit():
+    cache = MemoryCache(max_bytes=10)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    assert cache.get('a') == b'1234'
+
+    # 'b' is the least recently used entry
+    cache.set('c', b'1234')
+    assert cache.get('a') == b'1234'
+    assert cache.get('b') is None
+    assert cache.get('c') == b'1234'
+
+    # Values over the limit are not stored at all
+    cache.set('d', b'12345678901')
+    assert cache.get('d') is None
+    assert cache.get('a') == b'1234'
+
+
+def test_file_cache_limit(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=10)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    assert cache.get('a') == b'1234'
+
+    # Old files are removed to make room
+    cache.set('c', b'1234')
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert cache.get('c') == b'1234'
+
+    # Values over the limit are not stored at all
+    cache.set('d', b'12345678901')
+    assert cache.get('d') is None
+
+
+@pytest.mark.parametrize('make_cache', [
+    lambda tmp_path: FileCache(tmp_path),
+    lambda tmp_path: ChainCache(MemoryCache(100), FileCache(tmp_path)),
+])
+def test_cache(make_cache, tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get('key') is None
+    cache.set('key', b'value')
+    assert cache.get('key') == b'value'
+    assert make_cache(tmp_path).get('key') == b'value'
+    cache.clear()
+    assert cache.get('key') is None
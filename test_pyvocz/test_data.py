@@ -0,0 +1,342 @@
+import datetime
+import os
+import shutil
+
+import pytest
+
+from pyvocz.calendar import DAY, get_calendar, get_calendar_data
+from pyvocz.data import load_data, update_data
+from pyvocz.homepage import get_homepage
+from pyvocz.markup import render_markdown as markdown
+from pyvocz.memory import memory_report
+from pyvocz.typecheck import typecheck
+
+
+def test_snapshot(app, tmp_path):
+    datadir = app.config['PYVO_DATADIR']
+    snapshot = tmp_path / 'data.snapshot'
+
+    db = load_data(datadir, snapshot=snapshot)
+    assert snapshot.exists()
+
+    cached = load_data(datadir, snapshot=snapshot)
+    assert cached.version == db.version
+    assert [e.title for e in cached.events] == [e.title for e in db.events]
+    assert cached.events[0].series.events[0] is cached.events[0]
+
+
+def test_snapshot_outdated(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    snapshot = tmp_path / 'data.snapshot'
+
+    db = load_data(datadir, snapshot=snapshot)
+
+    # Touch a data file
+    filename = os.path.join(datadir, db.events[0]._source)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    reloaded = load_data(datadir, snapshot=snapshot)
+    assert reloaded.version != db.version
+
+
+def test_snapshot_unvalidated(app, tmp_path):
+    datadir = app.config['PYVO_DATADIR']
+    snapshot = tmp_path / 'data.snapshot'
+
+    assert not load_data(datadir, snapshot=snapshot, validate=False).validated
+
+    # A snapshot of data that wasn't checked is not trusted
+    assert load_data(datadir, snapshot=snapshot).validated
+
+    # A snapshot of checked data can be used without validation
+    assert load_data(datadir, snapshot=snapshot, validate=False).validated
+
+
+def test_snapshot_not_writable(app, tmp_path):
+    datadir = app.config['PYVO_DATADIR']
+    snapshot = tmp_path / 'missing-dir' / 'data.snapshot'
+
+    # The snapshot can't be written, but the data is still loaded
+    db = load_data(datadir, snapshot=snapshot)
+    assert db.events
+    assert not snapshot.exists()
+
+
+def summarize(db):
+    return [
+        (e.series.slug, e.slug, e.title, e.city.name,
+         e.venue.name if e.venue else None,
+         e.series is db.series[e.series.slug],
+         e.city is db.cities[e.city.slug])
+        for e in db.events
+    ]
+
+
+def test_update_data(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    db = load_data(datadir)
+    [changed, removed, *rest] = db.series['brno-pyvo'].events
+    unchanged_series = db.series['praha-pyvo']
+    before = summarize(db)
+
+    with open(os.path.join(datadir, changed._source), 'a') as f:
+        f.write('topic: Updated topic\n')
+    os.unlink(os.path.join(datadir, removed._source))
+    venue_file = 'cities/ostrava/venues/ires-sc.yaml'
+    with open(os.path.join(datadir, venue_file), 'a') as f:
+        f.write('name: Renamed venue\n')
+
+    updated = update_data(db, datadir, [
+        changed._source, removed._source, venue_file,
+    ])
+
+    assert summarize(updated) == summarize(load_data(datadir))
+    assert updated.series['praha-pyvo'] is unchanged_series
+    assert 'Updated topic' in updated.series['brno-pyvo'].events[0].title
+    assert updated.venues['ires-sc'].name == 'Renamed venue'
+    assert updated.series['brno-pyvo'].events[0].description_html
+
+    # The old data is not modified
+    assert summarize(db) == before
+    for event in db.events:
+        assert event.series is db.series[event.series.slug]
+        assert event.city is db.cities[event.city.slug]
+        if event.venue:
+            assert event.venue is db.venues[event.venue.slug]
+        for talk in event.talks:
+            assert talk.event is event
+    for event in updated.events:
+        assert event.series is updated.series[event.series.slug]
+        assert event.city is updated.cities[event.city.slug]
+        if event.venue:
+            assert event.venue is updated.venues[event.venue.slug]
+        for talk in event.talks:
+            assert talk.event is event
+
+
+def test_event_indexes(app):
+    series = app.db.series['brno-pyvo']
+    for event in series.events:
+        assert series.events_by_slug[event.slug] is event
+        assert event in series.events_by_year[event.date.year]
+    assert series.years == sorted({e.date.year for e in series.events})
+    for event in app.db.events:
+        assert event in app.db.events_by_date[event.date]
+
+
+def test_calendar_memoized(app):
+    db = app.db
+    event = db.events[0]
+    calendar = get_calendar(
+        db, first_year=event.date.year, first_month=event.date.month,
+        num_months=1,
+    )
+    [weeks] = calendar.values()
+    days = [day for week in weeks for day in week]
+    assert any(event in day['events'] for day in days)
+    again = get_calendar(
+        db, first_year=event.date.year, first_month=event.date.month,
+        num_months=1,
+    )
+    assert list(again.values())[0] is weeks
+
+
+def test_calendar_range(app):
+    db = app.db
+    event = db.series['brno-pyvo'].events_by_slug['2014-07']
+    assert event.date == datetime.date(2014, 7, 31)
+
+    def august_events(**kwargs):
+        calendar = get_calendar(db, first_year=2014, **kwargs)
+        weeks = calendar[2014, 8]
+        return [e for week in weeks for day in week for e in day['events']]
+
+    # The August grid starts in July, but only shows events in the range
+    # of the calendar
+    assert event not in august_events(first_month=8, num_months=1)
+    assert event in august_events(first_month=7, num_months=2)
+    assert event not in august_events(first_month=8, num_months=1)
+
+    # Planned occurrences are shown in the same range as events
+    series = db.series['brno-pyvo']
+    occurrence = series.planned_occurrences[0].date()
+    calendar_data = get_calendar_data(db)
+    for end, expected in (occurrence, []), (occurrence + DAY, [series]):
+        weeks = calendar_data.get_month(
+            occurrence.year, occurrence.month, frozenset({series.slug}),
+            start=occurrence.replace(day=1), end=end,
+        )
+        days = {day['day']: day for week in weeks for day in week}
+        assert days[occurrence]['next_occurences'] == expected
+
+
+def test_duplicate_event_slug(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    event = app.db.series['brno-pyvo'].events[0]
+    source = os.path.join(datadir, event._source)
+    shutil.copyfile(source, source.replace('.yaml', '-copy.yaml'))
+
+    with pytest.raises(ValueError, match='duplicate event slug'):
+        load_data(datadir)
+
+
+def test_bad_recurrence_rule(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    # The rule is checked even in a series that has no events yet
+    series_dir = datadir / 'series' / 'new-pyvo'
+    series_dir.mkdir()
+    text = (datadir / 'series' / 'brno-pyvo' / 'series.yaml').read_text()
+    (series_dir / 'series.yaml').write_text(
+        text.replace('FREQ=MONTHLY', 'FREQ=SOMETIMES'),
+    )
+
+    with pytest.raises(ValueError, match='SOMETIMES'):
+        load_data(datadir)
+
+
+def test_next_occurrences(app):
+    series = app.db.series['brno-pyvo']
+    last_date = series.events[-1].date
+    occurrences = list(series.next_occurrences(30))
+    assert len(occurrences) == 30
+    assert occurrences == sorted(occurrences)
+    assert occurrences[0].date() > last_date
+    # Occurrences past the precomputed window continue seamlessly
+    assert occurrences[:3] == list(series.next_occurrences(3))
+    since = occurrences[26].date()
+    assert list(series.next_occurrences(2, since=since)) == occurrences[27:29]
+
+
+def test_markdown_prerendered(app):
+    for event in app.db.events:
+        if event.description:
+            assert event.description_html == markdown(event.description)
+        for talk in event.talks:
+            if talk.description:
+                assert talk.description_html == markdown(talk.description)
+
+
+def test_typecheck_error(app):
+    db = load_data(app.config['PYVO_DATADIR'])
+    db.series['brno-pyvo'].events[1].talks[0].title = 7
+    with pytest.raises(TypeError) as excinfo:
+        typecheck(db)
+    assert str(excinfo.value).startswith(
+        ".series['brno-pyvo'].events[1].talks[0].title: 7 is not a"
+    )
+
+
+def test_lazy_bodies(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    eager = load_data(datadir)
+    snapshot = tmp_path / 'snapshot'
+    lazy = load_data(datadir, lazy_bodies=2, snapshot=snapshot)
+    assert all(event._body is None for event in lazy.events)
+
+    for event, lazy_event in zip(eager.events, lazy.events):
+        assert lazy_event.description_html == event.description_html
+        assert [t.title for t in lazy_event.talks] == [
+            t.title for t in event.talks
+        ]
+        assert all(t.event is lazy_event for t in lazy_event.talks)
+    assert sum(event._body is not None for event in lazy.events) == 2
+
+    # Snapshots are only used in the mode they were saved in
+    assert load_data(datadir, snapshot=snapshot).event_bodies is None
+    from_snapshot = load_data(datadir, lazy_bodies=2, snapshot=snapshot)
+    assert from_snapshot.event_bodies is not None
+    first_talk = from_snapshot.events[0].talks[0]
+    assert first_talk.title == eager.events[0].talks[0].title
+
+    # Bodies are not loaded from files that changed after the data was
+    # loaded (they might not match the rest of the event)
+    event = lazy.series['brno-pyvo'].events[0]
+    assert event._body is None
+    with open(os.path.join(datadir, event._source), 'a') as f:
+        f.write('description: Changed\n')
+    assert event.talks == []
+    assert event.description is None
+
+
+def test_lazy_bodies_typecheck(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    event = app.db.series['brno-pyvo'].events[1]
+    with open(os.path.join(datadir, event._source), 'a') as f:
+        f.write('description: 7\n')
+
+    # Details of events are checked when the data is loaded, even if they
+    # are loaded lazily later
+    with pytest.raises(TypeError) as excinfo:
+        load_data(datadir, lazy_bodies=2)
+    assert str(excinfo.value).startswith(
+        ".series['brno-pyvo'].events[1].description: 7 is not a"
+    )
+
+
+def test_speakers_interned(app, tmp_path):
+    snapshot = tmp_path / 'snapshot'
+    load_data(app.config['PYVO_DATADIR'], snapshot=snapshot)
+    for db in app.db, load_data(app.config['PYVO_DATADIR'], snapshot=snapshot):
+        speakers = {}
+        for event in db.events:
+            for talk in event.talks:
+                for speaker in talk.speakers:
+                    assert speakers.setdefault(speaker.name, speaker) is speaker
+
+        report = memory_report(db)
+        assert report['Speaker']['count'] == len(speakers)
+        assert report['Event']['count'] == len(db.events)
+
+
+def test_media_index(app, tmp_path):
+    db = app.db
+    videos = [
+        link
+        for event in reversed(db.events)
+        for talk in event.talks
+        for link in talk.links
+        if link.kind == 'video'
+    ]
+    assert videos
+    assert db.media.videos == videos
+    assert db.media.videos_by_series['brno-pyvo'] == [
+        link for link in videos
+        if link.talk.event.series.slug == 'brno-pyvo'
+    ]
+    speaker = videos[0].talk.speakers[0]
+    assert db.media.videos_by_speaker[speaker.name] == [
+        link for link in videos if speaker in link.talk.speakers
+    ]
+
+    # With lazy event details, the index is built from talk summaries,
+    # without loading the details
+    lazy = load_data(app.config['PYVO_DATADIR'], lazy_bodies=2)
+    assert [
+        (link.url, link.talk.title, link.talk.speakers, link.talk.event.slug)
+        for link in lazy.media.videos
+    ] == [
+        (link.url, link.talk.title, link.talk.speakers, link.talk.event.slug)
+        for link in videos
+    ]
+    assert all(event._body is None for event in lazy.events)
+
+
+def test_homepage_memoized(app):
+    day = datetime.date(2015, 3, 1)
+    homepage = get_homepage(app.db, day)
+    assert get_homepage(app.db, day) is homepage
+    assert get_homepage(app.db, day + datetime.timedelta(days=1)) is not homepage
+
+    featured = homepage.featured_events
+    assert featured
+    upcoming = [e for e in featured if e.date >= day]
+    assert featured[:len(upcoming)] == upcoming
+    assert all(e.date < day for e in homepage.past_events)
+    assert homepage.videos == app.db.media.videos[:len(homepage.videos)]
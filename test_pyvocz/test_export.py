@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import pytest
+
+from pyvocz.export import export_site, site_pages
+
+
+def test_export(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    out = tmp_path / 'site'
+
+    assert export_site(out, datadir=datadir) > 0
+    assert (out / 'index.html').exists()
+    assert (out / 'index.html.gz').exists()
+    assert (out / 'en' / 'brno-pyvo' / 'index.html').exists()
+    assert (out / 'brno-pyvo' / '2014-07' / 'qrcode.png').exists()
+    assert (out / 'api' / 'pyvo.ics').exists()
+    assert b'/search/' not in (out / 'index.html').read_bytes()
+
+    # JSON pages are written with the right extension, and nginx is told
+    # how to serve them
+    geo_dir = out / 'api' / 'venues' / 'ires-sc' / 'geo'
+    assert (geo_dir / 'index.json').exists()
+    assert not (geo_dir / 'index.html').exists()
+    nginx_config = (out / '.pyvocz-nginx.conf').read_text()
+    assert 'index index.html index.json;' in nginx_config
+    assert 'text/calendar ics;' in nginx_config
+
+    # Nothing changed, nothing is rendered again
+    assert export_site(out, datadir=datadir) == 0
+
+    # Only pages that depend on a changed event file are rendered again
+    event = app.db.series['brno-pyvo'].events[-1]
+    filename = os.path.join(datadir, event._source)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    rerendered = export_site(out, datadir=datadir)
+    assert 0 < rerendered < 100
+
+
+def test_export_unknown_endpoint(app):
+    # New routes need to be either exported or explicitly skipped
+    app.add_url_rule('/new-page/', 'new_page', lambda: 'New page')
+    with pytest.raises(ValueError, match='new_page'):
+        dict(site_pages(app, 'https://pyvo.cz'))
@@ -0,0 +1,118 @@
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from pyvocz import prefork
+from pyvocz.app import create_app
+
+
+def make_app(datadir, snapshot):
+    return create_app(
+        datadir=datadir, echo=False, pull_password='secret',
+        snapshot=snapshot, config={'PYVO_PREGENERATE_QRCODES': False},
+    )
+
+
+@pytest.mark.parametrize('use_snapshot', [True, False])
+def test_reload_syncs_workers(app, tmp_path, use_snapshot):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    snapshot = tmp_path / 'snapshot' if use_snapshot else None
+    worker = make_app(datadir, snapshot)
+    sibling = make_app(datadir, snapshot)
+
+    event = worker.db.series['brno-pyvo'].events[0]
+    with open(datadir / event._source, 'a') as f:
+        f.write('topic: Updated topic\n')
+
+    job = worker.reloader.enqueue('update', changed_paths=[event._source])
+    assert worker.reloader.wait(timeout=60)
+    assert worker.reloader.get_job(job['id'])['status'] == 'done'
+    new_version = worker.db.version
+    assert 'Updated topic' in worker.db.series['brno-pyvo'].events[0].title
+
+    # The sibling notices the new generation, and loads the new data
+    assert sibling.db.version != new_version
+    sibling.reloader.check_generation()
+    assert sibling.reloader.wait(timeout=60)
+    assert sibling.db.version == new_version
+    assert sibling.reloader.get_job(job['id'])['status'] == 'done'
+
+
+def test_reload_hook(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    app = make_app(datadir, tmp_path / 'snapshot')
+    client = app.test_client()
+
+    assert client.post('/api/reload_hook').status_code == 500
+
+    # The data directory isn't a Git repository, so the job fails
+    result = client.post('/api/reload_hook?password=secret')
+    assert result.status_code == 202
+    assert 'secret' not in result.text
+    job_id = result.json['job']
+    assert app.reloader.wait(timeout=60)
+
+    status_url = f'/api/reload_status?job={job_id}'
+    assert client.get(status_url).status_code == 500
+    result = client.get(f'{status_url}&password=secret')
+    assert result.status_code == 200
+    assert result.json['job']['status'] == 'failed'
+    assert result.json['version'] == app.db.version
+    assert [w['version'] for w in result.json['workers']] == [app.db.version]
+
+
+def test_prefork_reload(app, tmp_path, monkeypatch):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    snapshot = tmp_path / 'snapshot'
+    master = make_app(datadir, snapshot)
+    worker = make_app(datadir, snapshot)
+    prefork.enable(master)
+    worker.reloader.master_pid = 12345
+    reload_requests = []
+    monkeypatch.setattr(prefork, 'request_reload', reload_requests.append)
+
+    event = worker.db.series['brno-pyvo'].events[0]
+    with open(datadir / event._source, 'a') as f:
+        f.write('topic: Updated topic\n')
+
+    worker.reloader.enqueue('update', changed_paths=[event._source])
+    assert worker.reloader.wait(timeout=60)
+    new_version = worker.db.version
+    assert reload_requests == [12345]
+
+    # The master doesn't sync by itself; it loads new data when asked to
+    master.reloader.check_generation()
+    assert master.reloader.wait(timeout=60)
+    assert master.db.version != new_version
+    prefork.reload_data(master)
+    assert master.db.version == new_version
+    assert 'Updated topic' in master.db.series['brno-pyvo'].events[0].title
+
+
+def test_reload_state_dir(app, tmp_path):
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    code = f"""if True:
+        from pyvocz.app import create_app
+        app = create_app(datadir={str(datadir)!r}, echo=False)
+        app.test_client().get('/')
+        assert list((app.reloader.state_dir / 'workers').glob('*.json'))
+        print(app.reloader.state_dir)
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        check=True, stdout=subprocess.PIPE, encoding='utf-8',
+    )
+    state_dir = Path(result.stdout.strip())
+
+    # Nothing is written to the data directory, and the worker's file
+    # is removed when it exits
+    assert not state_dir.is_relative_to(datadir)
+    assert not any(p.name.startswith('.') for p in datadir.iterdir())
+    assert not list((state_dir / 'workers').glob('*.json'))
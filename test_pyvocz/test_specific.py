@@ -1,7 +1,223 @@
+import subprocess
+import sys
+
+from pyvocz.app import create_app
+
 
 def test_404(client):
     result = client.get('http://localhost/nonexistent-city/')
     assert result.status_code == 404
 
 
+def test_etag(app, client):
+    result = client.get('/brno-pyvo/')
+    assert result.status_code == 200
+    etag = result.headers['ETag']
+
+    result = client.get('/brno-pyvo/', headers={'If-None-Match': etag})
+    assert result.status_code == 304
+
+    result = client.get('/praha-pyvo/', headers={'If-None-Match': etag})
+    assert result.status_code == 200
+
+    # Another process serving the same data gives the same ETag
+    other = create_app(datadir=app.config['PYVO_DATADIR'], echo=False)
+    assert other.test_client().get('/brno-pyvo/').headers['ETag'] == etag
+
+
+def test_feed_window(client):
+    result = client.get('/api/pyvo.rss')
+    assert result.data.count(b'<item>') > 2
+
+    result = client.get('/api/pyvo.rss?limit=2')
+    assert result.data.count(b'<item>') == 2
+
+    result = client.get('/api/pyvo.rss?since=2015-01-01')
+    assert result.data.count(b'<item>') == 4
+
+    assert client.get('/api/pyvo.rss?since=yesterday').status_code == 400
+    assert client.get('/api/pyvo.rss?limit=abc').status_code == 400
+    assert client.get('/api/pyvo.rss?limit=-1').status_code == 400
+
+    # Other query arguments don't matter
+    result = client.get('/api/pyvo.rss?limit=2&utm_source=test')
+    assert result.data.count(b'<item>') == 2
+    assert b'utm_source' not in result.data
+
+
+def test_feed_conditional(client):
+    # The first response is streamed, and cached once complete
+    result = client.get('/api/series/brno-pyvo.ics')
+    assert result.status_code == 200
+    assert 'Last-Modified' in result.headers
+    assert result.data.startswith(b'BEGIN:VCALENDAR\r\n')
+    assert b'\r\nRRULE:' in result.data
+    last_modified = result.headers['Last-Modified']
+
+    # Clients can revalidate the streamed response by its date
+    result = client.get('/api/pyvo.ics', headers={
+        'If-Modified-Since': last_modified,
+    })
+    assert result.status_code == 304
+
+    result = client.get('/api/series/brno-pyvo.ics')
+    assert result.status_code == 200
+
+    result = client.get('/api/series/brno-pyvo.ics', headers={
+        'If-None-Match': result.headers['ETag'],
+    })
+    assert result.status_code == 304
+
+
 # XXX: Check that site works with empty DB
+
+
+def test_search(client):
+    # Diacritics and case don't matter
+    result = client.get('/api/search.json?q=ZASE+Docker')
+    assert result.status_code == 200
+    assert result.json['total'] > 1
+    [first, *rest] = result.json['results']
+    assert first['type'] == 'event'
+    assert first['url'] == 'http://localhost/praha-pyvo/2015-03/'
+
+    result = client.get('/api/search.json?q=zase+docker&per_page=1&page=2')
+    assert result.json['results'] == rest[:1]
+
+    result = client.get('/api/search.json?q=novak')
+    assert 'Petr Novák' in result.json['results'][0]['speakers']
+
+    result = client.get('/api/search.json?q=nonexistent+docker')
+    assert result.json['total'] == 0
+
+    assert client.get('/api/search.json?q=docker&page=0').status_code == 400
+
+    result = client.get('/en/search/?q=docker')
+    assert result.status_code == 200
+    assert b'/en/praha-pyvo/2015-03/' in result.data
+
+
+def test_search_lazy(app):
+    # With lazy event details, talks are found by title and speakers,
+    # without loading the details
+    app = create_app(
+        datadir=app.config['PYVO_DATADIR'], echo=False,
+        config={'PYVO_LAZY_EVENT_BODIES': 2},
+    )
+    result = app.test_client().get('/api/search.json?q=ZASE+Docker')
+    assert result.json['total'] > 1
+    assert all(event._body is None for event in app.db.events)
+
+
+def test_feed_lazy(app):
+    # Feeds of all events don't load details of all events
+    app = create_app(
+        datadir=app.config['PYVO_DATADIR'], echo=False,
+        config={'PYVO_LAZY_EVENT_BODIES': 2},
+    )
+    client = app.test_client()
+    for url in '/api/pyvo.ics', '/api/pyvo.rss':
+        assert b'bitva tri cisaru' in client.get(url).data
+    assert all(event._body is None for event in app.db.events)
+
+
+def test_metrics(app):
+    result = app.test_client().get('/_metrics', follow_redirects=True)
+    assert result.status_code == 404
+
+    app = create_app(
+        datadir=app.config['PYVO_DATADIR'], echo=False,
+        pull_password='secret',
+        config={'PYVO_METRICS': True, 'PYVO_PREGENERATE_QRCODES': False},
+    )
+    client = app.test_client()
+    result = client.get('/')
+    assert result.status_code == 200
+    timing = result.headers['Server-Timing']
+    for stage in 'calendar', 'render', 'total', 'view':
+        assert f'{stage};dur=' in timing
+
+    assert client.get('/_metrics').status_code == 500
+    result = client.get('/_metrics?password=secret')
+    assert 'endpoint="index",stage="render",le="+Inf"} 1\n' in result.text
+
+    # Streamed feeds are timed until the whole body is generated
+    result = client.get('/api/pyvo.ics')
+    assert result.is_streamed
+    [header_time] = [
+        float(part.split('dur=')[1]) / 1000
+        for part in result.headers['Server-Timing'].split(', ')
+        if part.startswith('feed;')
+    ]
+    assert result.data.endswith(b'END:VCALENDAR\r\n')
+    result.close()
+    result = client.get('/_metrics?password=secret')
+    [feed_time] = [
+        float(line.split()[-1]) for line in result.text.splitlines()
+        if line.startswith('pyvocz_request_stage_seconds_sum{')
+        and 'endpoint="api_feed",stage="feed"' in line
+    ]
+    assert feed_time > header_time
+
+    assert client.get('/?_profile=1').status_code == 500
+    result = client.get('/?_profile=1&password=secret')
+    assert result.mimetype == 'text/plain'
+    assert 'function calls' in result.text
+
+
+def test_warm_up(app, tmp_path):
+    app = create_app(
+        datadir=app.config['PYVO_DATADIR'], echo=False,
+        cache_dir=tmp_path,
+        config={'PYVO_WARM_UP': True, 'PYVO_PREGENERATE_QRCODES': False},
+    )
+    # Compiled templates are cached
+    assert list((tmp_path / 'templates').iterdir())
+
+    # Pages are rendered and cached: they're served even if rendering
+    # would fail now
+    app.jinja_env.globals['url_for'] = None
+    assert app.test_client().get('/en/brno-pyvo/').status_code == 200
+
+
+def test_page_cache_ignores_query(app, client):
+    result = client.get('/en/brno-pyvo/?utm_source=test')
+    assert b'utm_source' not in result.data
+
+    # Pages for other hosts have their own absolute URLs
+    result = client.get('/en/brno-pyvo/', base_url='https://example.org')
+    assert b'https://example.org/en/brno-pyvo/' in result.data
+
+    # The page is served from the cache, whatever the query string
+    app.jinja_env.globals['url_for'] = None
+    assert client.get('/en/brno-pyvo/?page=2').status_code == 200
+
+
+def test_qrcode(client):
+    result = client.get('/en/brno-pyvo/2014-07/qrcode.png')
+    assert result.status_code == 200
+    assert result.mimetype == 'image/png'
+
+    # QR codes are only served for existing events
+    assert client.get('/brno-pyvo/1999-01/qrcode.png').status_code == 404
+    assert client.get('/no-such-pyvo/2014-07/qrcode.png').status_code == 404
+
+
+def test_qrcode_not_pregenerated(app):
+    app = create_app(datadir=app.config['PYVO_DATADIR'], echo=False)
+    client = app.test_client()
+    assert b'qrcode.png' not in client.get('/brno-pyvo/2014-07/').data
+    assert client.get('/brno-pyvo/2014-07/qrcode.png').status_code == 404
+
+
+def test_qrcode_not_imported(app):
+    # Without pregenerated QR codes, the `qrcode` library is never needed
+    # (and importing it takes a while)
+    code = f"""if True:
+        import sys
+        from pyvocz.app import create_app
+        app = create_app(datadir={app.config['PYVO_DATADIR']!r}, echo=False)
+        app.test_client().get('/brno-pyvo/2014-07/')
+        assert 'qrcode' not in sys.modules
+    """
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,47 @@
+import shutil
+import time
+
+import pytest
+
+from pyvocz import watch
+from pyvocz.app import create_app
+
+
+@pytest.mark.parametrize('use_inotify', [False, True])
+def test_watch(app, tmp_path, monkeypatch, use_inotify):
+    if use_inotify and watch.inotify_simple is None:
+        pytest.skip('inotify_simple is not installed')
+    monkeypatch.setattr(watch, 'POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(watch, 'DEBOUNCE_DELAY', 0.05)
+    datadir = tmp_path / 'data'
+    shutil.copytree(app.config['PYVO_DATADIR'], datadir)
+    app = create_app(
+        datadir=datadir, echo=False,
+        config={'PYVO_PREGENERATE_QRCODES': False},
+    )
+    watch.start_watching(app, use_inotify=use_inotify)
+    time.sleep(0.2)
+
+    event = app.db.series['brno-pyvo'].events[0]
+    with open(datadir / event._source, 'a') as f:
+        f.write('topic: Updated topic\n')
+    (datadir / app.db.series['brno-pyvo'].events[1]._source).unlink()
+
+    for i in range(100):
+        time.sleep(0.05)
+        if 'Updated topic' in app.db.series['brno-pyvo'].events[0].title:
+            break
+    assert 'Updated topic' in app.db.series['brno-pyvo'].events[0].title
+    assert app.reloader.wait(timeout=60)
+
+    # Invalid data is reported, and the old data is kept
+    old_db = app.db
+    with open(datadir / event._source, 'a') as f:
+        f.write('start: not a date\n')
+    for i in range(100):
+        time.sleep(0.05)
+        jobs = app.reloader.status()['jobs']
+        if jobs[-1]['status'] == 'failed':
+            break
+    assert jobs[-1]['status'] == 'failed'
+    assert app.db is old_db